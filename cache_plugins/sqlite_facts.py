@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+# Fact cache keeping every host in one local SQLite file
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    author: mac-dev-playbook maintainers
+    name: sqlite_facts
+    short_description: Compressed, incrementally updated fact cache in a single local SQLite file
+    description:
+        - Stores the facts of all hosts in one SQLite database (WAL journal, memory-mapped reads) instead of one
+          JSON file per host.
+        - Every top-level fact is stored as its own zlib-compressed row together with a digest of its JSON form,
+          so updating a host only rewrites the facts that actually changed.
+        - Can mirror the cache to a directory in the layout of the C(jsonfile) cache plugin (for example a
+          synced folder), from a background thread so the play does not wait for slow filesystems.
+    options:
+      _uri:
+        required: true
+        description:
+          - Directory holding the database, C(facts.sqlite).
+        type: path
+        env:
+          - name: ANSIBLE_CACHE_PLUGIN_CONNECTION
+        ini:
+          - key: fact_caching_connection
+            section: defaults
+      _prefix:
+        description: Prefix for the host keys (and exported file names).
+        env:
+          - name: ANSIBLE_CACHE_PLUGIN_PREFIX
+        ini:
+          - key: fact_caching_prefix
+            section: defaults
+      _timeout:
+        default: 86400
+        description:
+          - Seconds after which the facts of a host expire and are evicted; C(0) keeps them forever.
+        env:
+          - name: ANSIBLE_CACHE_PLUGIN_TIMEOUT
+        ini:
+          - key: fact_caching_timeout
+            section: defaults
+        type: integer
+      export_dir:
+        description:
+          - Directory receiving one JSON file per updated host, readable by the C(jsonfile) cache plugin.
+          - Written asynchronously; the controller waits for pending exports only when it exits.
+        type: path
+        env:
+          - name: ANSIBLE_CACHE_SQLITE_FACTS_EXPORT_DIR
+        ini:
+          - key: export_dir
+            section: cache_sqlite_facts
+'''
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+from ansible.errors import AnsibleError
+from ansible.module_utils.common.text.converters import to_native
+from ansible.parsing.ajson import AnsibleJSONDecoder, AnsibleJSONEncoder
+from ansible.plugins.cache import BaseCacheModule
+from ansible.utils.display import Display
+
+display = Display()
+
+DATABASE_NAME = 'facts.sqlite'
+MMAP_SIZE = 64 * 1024 * 1024
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS facts (
+    host TEXT NOT NULL,
+    name TEXT NOT NULL,
+    digest BLOB NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (host, name)
+) WITHOUT ROWID;
+'''
+
+
+def encode_fact(value):
+    return json.dumps(value, cls=AnsibleJSONEncoder, sort_keys=True, separators=(',', ':'))
+
+
+def decode_fact(data):
+    return json.loads(zlib.decompress(data).decode('utf-8'), cls=AnsibleJSONDecoder)
+
+
+class JsonExporter(object):
+    """Writes jsonfile-compatible host files from one background thread, newest state per host wins."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, key, document):
+        with self._lock:
+            self._pending[key] = document
+            if self._thread is None or not self._thread.is_alive():
+                # Not a daemon: the interpreter waits for the last export before exiting
+                self._thread = threading.Thread(target=self._run, name='sqlite_facts-export')
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                key, document = self._pending.popitem()
+            try:
+                self._write(key, document)
+            except (IOError, OSError) as e:
+                display.warning('sqlite_facts: could not export facts of %s to %s: %s'
+                                % (key, self.directory, to_native(e)))
+
+    def _write(self, key, document):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.%s.' % key)
+        with os.fdopen(fd, 'w') as f:
+            f.write(document)
+        os.replace(tmp, os.path.join(self.directory, key))
+
+
+class CacheModule(BaseCacheModule):
+    """
+    A caching module backed by a single SQLite file.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CacheModule, self).__init__(*args, **kwargs)
+
+        directory = self.get_option('_uri')
+        if not directory:
+            raise AnsibleError('sqlite_facts requires fact_caching_connection to be set to a directory')
+        self._path = os.path.join(os.path.expanduser(directory), DATABASE_NAME)
+        self._timeout = float(self.get_option('_timeout'))
+        self._prefix = self.get_option('_prefix') or ''
+        export_dir = self.get_option('export_dir')
+        self._exporter = JsonExporter(os.path.expanduser(export_dir)) if export_dir else None
+
+        self._cache = {}
+        # host -> {fact name: digest} of what is stored, to find the changed facts without reading them back
+        self._digests = {}
+        self._db = None
+        self._pid = None
+
+    def _connection(self):
+        # Never reuse a connection inherited across fork()
+        if self._db is None or self._pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            try:
+                self._db = sqlite3.connect(self._path, isolation_level=None)
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute('PRAGMA synchronous=NORMAL')
+                self._db.execute('PRAGMA mmap_size=%d' % MMAP_SIZE)
+                self._db.executescript(SCHEMA)
+            except sqlite3.Error as e:
+                raise AnsibleError('sqlite_facts: could not open %s: %s' % (self._path, to_native(e)))
+            self._pid = os.getpid()
+            self._evict()
+        return self._db
+
+    def _evict(self):
+        if not self._timeout:
+            return
+        cutoff = time.time() - self._timeout
+        db = self._db
+        with db:
+            db.execute('BEGIN')
+            db.execute('DELETE FROM facts WHERE host IN (SELECT host FROM hosts WHERE updated < ?)', (cutoff,))
+            db.execute('DELETE FROM hosts WHERE updated < ?', (cutoff,))
+
+    def _host(self, key):
+        return '%s%s' % (self._prefix, key)
+
+    def _updated(self, key):
+        row = self._connection().execute('SELECT updated FROM hosts WHERE host = ?', (self._host(key),)).fetchone()
+        if row is None:
+            return None
+        if self._timeout and time.time() - row[0] > self._timeout:
+            self.delete(key)
+            return None
+        return row[0]
+
+    def get(self, key):
+        if key in self._cache:
+            return self._cache[key]
+        if self._updated(key) is None:
+            raise KeyError
+        value = {}
+        digests = {}
+        for name, digest, data in self._connection().execute(
+                'SELECT name, digest, data FROM facts WHERE host = ?', (self._host(key),)):
+            value[name] = decode_fact(data)
+            digests[name] = digest
+        self._cache[key] = value
+        self._digests[key] = digests
+        return value
+
+    def set(self, key, value):
+        host = self._host(key)
+        db = self._connection()
+        if key not in self._digests:
+            self._digests[key] = dict(db.execute('SELECT name, digest FROM facts WHERE host = ?', (host,)))
+        stored = self._digests[key]
+
+        encoded = dict((name, encode_fact(fact)) for name, fact in value.items())
+        digests = dict((name, hashlib.sha1(data.encode('utf-8')).digest()) for name, data in encoded.items())
+        changed = [name for name in encoded if stored.get(name) != digests[name]]
+        removed = [name for name in stored if name not in encoded]
+
+        try:
+            with db:
+                db.execute('BEGIN')
+                db.executemany('INSERT OR REPLACE INTO facts (host, name, digest, data) VALUES (?, ?, ?, ?)',
+                               [(host, name, digests[name], zlib.compress(encoded[name].encode('utf-8')))
+                                for name in changed])
+                db.executemany('DELETE FROM facts WHERE host = ? AND name = ?', [(host, name) for name in removed])
+                db.execute('INSERT OR REPLACE INTO hosts (host, updated) VALUES (?, ?)', (host, time.time()))
+        except sqlite3.Error as e:
+            display.warning('sqlite_facts: error while trying to write facts of %s to %s: %s'
+                            % (key, self._path, to_native(e)))
+            return
+
+        self._cache[key] = value
+        self._digests[key] = digests
+
+        if self._exporter is not None and (changed or removed):
+            document = '{%s}' % ','.join('%s:%s' % (json.dumps(name), encoded[name]) for name in sorted(encoded))
+            self._exporter.submit(host, document)
+
+    def keys(self):
+        cutoff = time.time() - self._timeout if self._timeout else 0
+        rows = self._connection().execute('SELECT host FROM hosts WHERE updated >= ?', (cutoff,))
+        prefix_length = len(self._prefix)
+        return [host[prefix_length:] for (host,) in rows if host.startswith(self._prefix)]
+
+    def contains(self, key):
+        if key in self._cache:
+            return True
+        return self._updated(key) is not None
+
+    def delete(self, key):
+        self._cache.pop(key, None)
+        self._digests.pop(key, None)
+        host = self._host(key)
+        db = self._connection()
+        with db:
+            db.execute('BEGIN')
+            db.execute('DELETE FROM facts WHERE host = ?', (host,))
+            db.execute('DELETE FROM hosts WHERE host = ?', (host,))
+
+    def flush(self):
+        self._cache = {}
+        self._digests = {}
+        db = self._connection()
+        with db:
+            db.execute('BEGIN')
+            if self._prefix:
+                like = self._prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+                db.execute("DELETE FROM facts WHERE host LIKE ? ESCAPE '\\'", (like,))
+                db.execute("DELETE FROM hosts WHERE host LIKE ? ESCAPE '\\'", (like,))
+            else:
+                db.execute('DELETE FROM facts')
+                db.execute('DELETE FROM hosts')
+
+    def copy(self):
+        return dict((key, self.get(key)) for key in self.keys())
+
+    def __getstate__(self):
+        return dict()
+
+    def __setstate__(self, data):
+        self.__init__()
@@ -16,51 +16,359 @@ DOCUMENTATION = '''
       - default_callback
     requirements:
       - set as stdout in configuration
+    options:
+      max_field_size:
+        description:
+          - Maximum number of characters printed for a single string in a result, such as the C(stdout) of C(brew upgrade).
+          - Longer strings keep their first and last lines up to this size, the middle is elided and the
+            full text is written to a file in O(spill_dir).
+          - C(0) prints every field in full.
+          - Results are printed as one message, so this is also what bounds the controller memory a huge result
+            takes.
+        type: int
+        default: 0
+        env:
+          - name: ANSIBLE_READABLE_YAML_MAX_FIELD_SIZE
+        ini:
+          - section: callback_readable_yaml
+            key: max_field_size
+      spill_dir:
+        description:
+          - Directory receiving the full text of fields elided because of O(max_field_size).
+          - Files are named after the SHA-1 of their content, so repeated output is stored once.
+        type: path
+        default: ~/.ansible/readable_yaml
+        env:
+          - name: ANSIBLE_READABLE_YAML_SPILL_DIR
+        ini:
+          - section: callback_readable_yaml
+            key: spill_dir
+      profile_tasks:
+        description:
+          - Record how long every task, host and loop item takes and print the slowest ones after the play recap.
+        type: bool
+        default: false
+        env:
+          - name: ANSIBLE_READABLE_YAML_PROFILE_TASKS
+        ini:
+          - section: callback_readable_yaml
+            key: profile_tasks
+      profile_top:
+        description: Number of entries shown in each section of the timing summary.
+        type: int
+        default: 20
+        env:
+          - name: ANSIBLE_READABLE_YAML_PROFILE_TOP
+        ini:
+          - section: callback_readable_yaml
+            key: profile_top
+      profile_output:
+        description:
+          - File receiving every recorded timing when O(profile_tasks) is enabled.
+          - Written as CSV if the name ends in C(.csv), otherwise as JSON.
+        type: path
+        env:
+          - name: ANSIBLE_READABLE_YAML_PROFILE_OUTPUT
+        ini:
+          - section: callback_readable_yaml
+            key: profile_output
+      fleet_dir:
+        description:
+          - Directory receiving one task log per host (C(<host>.log)), a C(progress.tsv) with the current task
+            and counters of every host while the play runs, and a C(summary.json) with the final stats.
+          - Used by the fleet mode of macapply/macupdate to show a live per-host progress view.
+        type: path
+        env:
+          - name: ANSIBLE_READABLE_YAML_FLEET_DIR
+        ini:
+          - section: callback_readable_yaml
+            key: fleet_dir
+      summary_file:
+        description:
+          - File receiving the final per-host stats as JSON, in the format of the C(summary.json) of O(fleet_dir).
+          - Written without the per-host logs and progress of O(fleet_dir); macapply passes it to
+            C(apply-state.py record) to see whether tasks failed or were rescued.
+        type: path
+        env:
+          - name: ANSIBLE_READABLE_YAML_SUMMARY_FILE
+        ini:
+          - section: callback_readable_yaml
+            key: summary_file
 '''
 
 import json
+import os
 import re
-import string
-import yaml
+import time
 
-from ansible.module_utils.common.text.converters import to_text
-
-try:  # ansible-core >= 2.19 requires accessing the class via the internal module
-    from ansible._internal._yaml import _dumper as _ansible_yaml_dumper
-    BaseDumper = _ansible_yaml_dumper.AnsibleDumper
-except Exception:  # pragma: no cover - fallback for older ansible releases
-    from ansible.parsing.yaml.dumper import AnsibleDumper as BaseDumper
+from collections.abc import MutableMapping, MutableSequence
+from functools import lru_cache
+from itertools import islice
 
+from ansible.module_utils.common.text.converters import to_text
 from ansible.plugins.callback import strip_internal_keys, module_response_deepcopy
 from ansible.plugins.callback.default import CallbackModule as Default
 
+# yaml, the Ansible dumper and the classes built on it are only imported once the first result is
+# rendered: ansible loads the stdout callback for every run, including single-task ones that print
+# little or nothing (see scripts/check-callback-import-time.py).
+
+
+# Characters that force a literal block scalar
+BLOCK_CHARS = u'[\u000a\u000d\u001c\u001d\u001e\u0085\u2028\u2029]'
+# Characters below U+00A0 that are not in string.printable
+UNPRINTABLE = u'[\u0000-\u0008\u000e-\u001f\u007f-\u009f]'
+# The same set plus \v, \f and \r, used when no tab expansion sits in between
+UNPRINTABLE_OR_BREAK = u'[\u0000-\u0008\u000b-\u001f\u007f-\u009f]'
+BREAK = r'[\x0b\x0c\r]'
+TRAILING_SPACES = r' +\n'
+
+# Only strings up to this size are memoized, so the cache stays small
+SANITIZE_CACHE_MAX_LENGTH = 64 * 1024
+
+
+@lru_cache(maxsize=None)
+def _regex(pattern):
+    """Compile ``pattern`` on first use; most runs never render a multi-line string"""
+    return re.compile(pattern)
+
 
 def should_use_block(value):
     """Returns true if string should be in block format"""
-    for c in u"\u000a\u000d\u001c\u001d\u001e\u0085\u2028\u2029":
-        if c in value:
-            return True
-    return False
-
-
-class ReadableDumper(BaseDumper):
-    """Custom dumper that keeps multi-line strings readable."""
-
-    def represent_scalar(self, tag, value, style=None):
-        if style is None and isinstance(value, str):
-            if should_use_block(value):
-                style = '|'
-                value = value.rstrip()
-                value = ''.join(x for x in value if x in string.printable or ord(x) >= 0xA0)
-                value = value.expandtabs()
-                value = re.sub(r'[\x0b\x0c\r]', '', value)
-                value = re.sub(r' +\n', '\n', value)
-            else:
-                style = self.default_style
-        node = yaml.representer.ScalarNode(tag, value, style=style)
-        if self.alias_key is not None:
-            self.represented_objects[self.alias_key] = node
-        return node
+    return _regex(BLOCK_CHARS).search(value) is not None
+
+
+def sanitize_block(value):
+    """Clean up a string so it can be rendered as a literal block scalar"""
+    value = value.rstrip()
+    if '\t' in value:
+        # expandtabs counts \v and \f as columns and resets on \r, so those
+        # must survive until the tabs have been expanded
+        value = _regex(UNPRINTABLE).sub('', value).expandtabs()
+        value = _regex(BREAK).sub('', value)
+    else:
+        value = _regex(UNPRINTABLE_OR_BREAK).sub('', value)
+    return _regex(TRAILING_SPACES).sub('\n', value)
+
+
+_sanitize_block_cached = lru_cache(maxsize=512)(sanitize_block)
+
+
+@lru_cache(maxsize=None)
+def base_dumper():
+    """The Ansible YAML dumper class of the running ansible-core, resolved on first use"""
+    try:  # ansible-core >= 2.19 requires accessing the class via the internal module
+        from ansible._internal._yaml import _dumper as _ansible_yaml_dumper
+        return _ansible_yaml_dumper.AnsibleDumper
+    except Exception:  # pragma: no cover - fallback for older ansible releases
+        from ansible.parsing.yaml.dumper import AnsibleDumper
+        return AnsibleDumper
+
+
+@lru_cache(maxsize=None)
+def dumper_classes():
+    """Build ``(ReadableDumper, FastReadableDumper)`` once, on first use"""
+    import yaml
+
+    try:  # libyaml bindings are optional, PyYAML falls back to the pure-Python emitter
+        from yaml.cyaml import CEmitter
+    except ImportError:  # pragma: no cover - PyYAML built without libyaml
+        CEmitter = None
+
+    class ReadableDumper(base_dumper()):
+        """Custom dumper that keeps multi-line strings readable."""
+
+        def represent_scalar(self, tag, value, style=None):
+            if style is None and isinstance(value, str):
+                if should_use_block(value):
+                    style = '|'
+                    if len(value) <= SANITIZE_CACHE_MAX_LENGTH:
+                        value = _sanitize_block_cached(value)
+                    else:
+                        value = sanitize_block(value)
+                else:
+                    style = self.default_style
+            node = yaml.representer.ScalarNode(tag, value, style=style)
+            if self.alias_key is not None:
+                self.represented_objects[self.alias_key] = node
+            return node
+
+    if CEmitter is None or issubclass(ReadableDumper, CEmitter):
+        return ReadableDumper, ReadableDumper
+
+    class FastReadableDumper(CEmitter, ReadableDumper):
+        """ReadableDumper that represents nodes in Python but emits them with libyaml."""
+
+        def __init__(self, stream, canonical=None, indent=None, width=None, allow_unicode=None,
+                     line_break=None, encoding=None, explicit_start=None, explicit_end=None,
+                     version=None, tags=None, **kwargs):
+            emitter_args = dict(canonical=canonical, indent=indent, width=width, allow_unicode=allow_unicode,
+                                line_break=line_break, encoding=encoding, explicit_start=explicit_start,
+                                explicit_end=explicit_end, version=version, tags=tags)
+            ReadableDumper.__init__(self, stream, **dict(emitter_args, **kwargs))
+            CEmitter.__init__(self, stream, **emitter_args)
+
+    return ReadableDumper, FastReadableDumper
+
+
+class _ExoticValue(Exception):
+    """Raised when a result contains containers the lazy view does not know how to copy."""
+
+
+def _is_internal_key(key):
+    return isinstance(key, str) and key.startswith('_ansible_')
+
+
+def _strip_internal_view(value):
+    """
+    Return ``value`` without ``_ansible_*`` keys, copying only the containers that change.
+
+    This is the copy-on-write equivalent of ``strip_internal_keys(module_response_deepcopy(value))``:
+    untouched subtrees are shared with the original result instead of being deep-copied.
+    """
+    if isinstance(value, dict):
+        stripped = None
+        for index, (key, item) in enumerate(value.items()):
+            if _is_internal_key(key):
+                if stripped is None:
+                    stripped = dict(islice(value.items(), index))
+                continue
+            new_item = _strip_internal_view(item)
+            if stripped is None:
+                if new_item is item:
+                    continue
+                stripped = dict(islice(value.items(), index))
+            stripped[key] = new_item
+        return value if stripped is None else stripped
+
+    if isinstance(value, list):
+        stripped = None
+        for index, item in enumerate(value):
+            new_item = _strip_internal_view(item)
+            if stripped is None:
+                if new_item is item:
+                    continue
+                stripped = value[:index]
+            stripped.append(new_item)
+        return value if stripped is None else stripped
+
+    if isinstance(value, (MutableMapping, MutableSequence)):
+        raise _ExoticValue(type(value).__name__)
+
+    return value
+
+
+def abridge_result(result):
+    """Return a top-level copy of ``result`` with internal keys stripped, sharing unchanged subtrees."""
+    try:
+        abridged = _strip_internal_view(result)
+    except _ExoticValue:
+        return strip_internal_keys(module_response_deepcopy(result))
+    return dict(abridged) if abridged is result else abridged
+
+
+def spill_text(value, spill_dir):
+    """Write ``value`` to a content-addressed file in ``spill_dir`` and return its path, or None on error."""
+    import hashlib
+
+    data = value.encode('utf-8', 'surrogateescape')
+    path = os.path.join(spill_dir, hashlib.sha1(data).hexdigest() + '.txt')
+    try:
+        if not os.path.exists(path):
+            os.makedirs(spill_dir, exist_ok=True)
+            with open(path, 'wb') as spill_file:
+                spill_file.write(data)
+    except OSError:
+        return None
+    return path
+
+
+def elide_text(value, max_size, spill_dir):
+    """Keep the head and tail of ``value`` (cut at line boundaries where possible) and elide the middle."""
+    half = max_size // 2
+    head = value[:half]
+    if '\n' in head:
+        head = head[:head.rindex('\n') + 1]
+    tail = value[len(value) - half:]
+    if '\n' in tail:
+        tail = tail[tail.index('\n') + 1:]
+    elided = len(value) - len(head) - len(tail)
+    path = spill_text(value, spill_dir)
+    where = 'full text in %s' % path if path else 'full text could not be saved'
+    return '%s\n[... %d characters elided, %s ...]\n\n%s' % (head, elided, where, tail)
+
+
+def elide_large_fields(value, max_size, spill_dir):
+    """Return ``value`` with oversized strings elided, copying only the containers that change."""
+    if isinstance(value, str):
+        return elide_text(value, max_size, spill_dir) if len(value) > max_size else value
+
+    if isinstance(value, dict):
+        elided = None
+        for key, item in value.items():
+            new_item = elide_large_fields(item, max_size, spill_dir)
+            if new_item is not item:
+                if elided is None:
+                    elided = dict(value)
+                elided[key] = new_item
+        return value if elided is None else elided
+
+    if isinstance(value, list):
+        elided = None
+        for index, item in enumerate(value):
+            new_item = elide_large_fields(item, max_size, spill_dir)
+            if new_item is not item:
+                if elided is None:
+                    elided = list(value)
+                elided[index] = new_item
+        return value if elided is None else elided
+
+    return value
+
+
+class IndentingWriter(object):
+    """
+    Text sink for yaml.dump that indents continuation lines while the document is emitted,
+    instead of splitting and re-joining the finished dump.
+
+    The chunks are still joined into one string: the default callback prints a result as a single
+    display message, so the whole document is held in memory. Use the max_field_size option to
+    bound the size of huge results.
+    """
+
+    # libyaml's CEmitter only writes text (not bytes) to streams with an encoding attribute
+    encoding = None
+
+    def __init__(self, indent='  '):
+        self._newline = '\n' + indent
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(data.replace('\n', self._newline))
+
+    def mark(self):
+        return len(self._chunks)
+
+    def rewind(self, mark):
+        del self._chunks[mark:]
+
+    def getvalue(self):
+        return ''.join(self._chunks)
+
+
+def dump_yaml(data, stream):
+    """Dump ``data`` to ``stream`` with the libyaml emitter, falling back to the pure-Python one if it refuses."""
+    import yaml
+
+    ReadableDumper, FastReadableDumper = dumper_classes()
+    dump_args = dict(allow_unicode=True, width=1000, default_flow_style=False)
+    if FastReadableDumper is not ReadableDumper:
+        mark = stream.mark()
+        try:
+            return yaml.dump(data, stream, Dumper=FastReadableDumper, **dump_args)
+        except (yaml.YAMLError, UnicodeError):
+            stream.rewind(mark)
+    return yaml.dump(data, stream, Dumper=ReadableDumper, **dump_args)
 
 
 class CallbackModule(Default):
@@ -73,14 +381,219 @@ class CallbackModule(Default):
     CALLBACK_TYPE = 'stdout'
     CALLBACK_NAME = 'readable_yaml'
 
+    PROFILE_FIELDS = ('task', 'path', 'host', 'item', 'status', 'duration')
+    FLEET_FIELDS = ('host', 'state', 'ok', 'changed', 'failed', 'skipped', 'unreachable', 'task')
+    # Seconds between two rewrites of progress.tsv
+    FLEET_PROGRESS_INTERVAL = 0.5
+
     def __init__(self):
         super(CallbackModule, self).__init__()
+        self._profile_started = {}
+        self._profile_item_marks = {}
+        self._profile_records = []
+        self._fleet_hosts = {}
+        self._fleet_written = 0
+
+    def _profile_enabled(self):
+        return self.get_option('profile_tasks')
+
+    def _profile_record(self, result, status, item=False):
+        task = result._task
+        host = result._host.get_name()
+        key = (task._uuid, host)
+        now = time.time()
+        if key not in self._profile_started:
+            return
+        if item:
+            # Loop items run one after another on a host, so each one starts where the previous ended
+            started = self._profile_item_marks.get(key, self._profile_started[key])
+            self._profile_item_marks[key] = now
+            label = to_text(self._get_item_label(result._result))
+        else:
+            started = self._profile_started.pop(key)
+            self._profile_item_marks.pop(key, None)
+            label = None
+        self._profile_records.append(dict(
+            task=task.get_name().strip(),
+            path=task.get_path(),
+            host=host,
+            item=label,
+            status=status,
+            duration=round(now - started, 4),
+        ))
+
+    def _fleet_host(self, host):
+        return self._fleet_hosts.setdefault(host, dict(host=host, state='running', ok=0, changed=0, failed=0,
+                                                       skipped=0, unreachable=0, task=''))
+
+    def _fleet_log(self, host, line):
+        try:
+            with open(os.path.join(self.get_option('fleet_dir'), '%s.log' % host), 'a') as log:
+                log.write('%s %s\n' % (time.strftime('%H:%M:%S'), line))
+        except OSError as e:
+            self._display.warning('Could not write fleet log for %s: %s' % (host, to_text(e)))
+
+    def _fleet_event(self, result, status, item=False):
+        host = result._host.get_name()
+        progress = self._fleet_host(host)
+        if status == 'ok' and result._result.get('changed', False):
+            status = 'changed'
+        if item:
+            label = '%s (item=%s)' % (result._task.get_name().strip(), to_text(self._get_item_label(result._result)))
+        else:
+            # Loop items are followed by one result for the whole task, which is what gets counted
+            label = result._task.get_name().strip()
+            if status != 'ignored':
+                progress[status] += 1
+            if status in ('failed', 'unreachable'):
+                progress['state'] = status
+        self._fleet_log(host, '%-11s %s' % (status, label))
+        if status in ('failed', 'ignored', 'unreachable') and result._result.get('msg'):
+            # Continuation lines line up with the message (timestamp + status column)
+            self._fleet_log(host, ' ' * 12 + to_text(result._result['msg']).replace('\n', '\n' + ' ' * 21))
+        self._write_fleet_progress()
+
+    def _write_fleet_progress(self, force=False):
+        now = time.time()
+        if not force and now - self._fleet_written < self.FLEET_PROGRESS_INTERVAL:
+            return
+        self._fleet_written = now
+        path = os.path.join(self.get_option('fleet_dir'), 'progress.tsv')
+        try:
+            with open(path + '.tmp', 'w') as progress:
+                progress.write('\t'.join(field.upper() for field in self.FLEET_FIELDS) + '\n')
+                for host in sorted(self._fleet_hosts):
+                    entry = self._fleet_hosts[host]
+                    progress.write('\t'.join(to_text(entry[field]).replace('\t', ' ') for field in self.FLEET_FIELDS) + '\n')
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            self._display.warning('Could not write fleet progress to %s: %s' % (path, to_text(e)))
+
+    def _write_summary(self, path, summary):
+        try:
+            with open(path, 'w') as f:
+                json.dump(summary, f, indent=2, sort_keys=True)
+        except OSError as e:
+            self._display.warning('Could not write summary to %s: %s' % (path, to_text(e)))
+
+    def _write_fleet_summary(self, summary):
+        for host in summary:
+            entry = self._fleet_host(host)
+            entry['task'] = ''
+            if summary[host]['unreachable']:
+                entry['state'] = 'unreachable'
+            elif summary[host]['failures']:
+                entry['state'] = 'failed'
+            else:
+                entry['state'] = 'done'
+        self._write_fleet_progress(force=True)
+        self._write_summary(os.path.join(self.get_option('fleet_dir'), 'summary.json'), summary)
+
+    def v2_runner_on_start(self, host, task):
+        if self._profile_enabled():
+            self._profile_started[(task._uuid, host.get_name())] = time.time()
+        if self.get_option('fleet_dir'):
+            # A host that starts another task after a failure was rescued
+            self._fleet_host(host.get_name()).update(state='running', task=task.get_name().strip())
+            self._write_fleet_progress()
+        super(CallbackModule, self).v2_runner_on_start(host, task)
+
+    def v2_runner_on_ok(self, result):
+        if self._profile_enabled():
+            self._profile_record(result, 'ok')
+        if self.get_option('fleet_dir'):
+            self._fleet_event(result, 'ok')
+        super(CallbackModule, self).v2_runner_on_ok(result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        if self._profile_enabled():
+            self._profile_record(result, 'failed')
+        if self.get_option('fleet_dir'):
+            self._fleet_event(result, 'ignored' if ignore_errors else 'failed')
+        super(CallbackModule, self).v2_runner_on_failed(result, ignore_errors=ignore_errors)
+
+    def v2_runner_on_skipped(self, result):
+        if self._profile_enabled():
+            self._profile_record(result, 'skipped')
+        if self.get_option('fleet_dir'):
+            self._fleet_event(result, 'skipped')
+        super(CallbackModule, self).v2_runner_on_skipped(result)
+
+    def v2_runner_on_unreachable(self, result):
+        if self._profile_enabled():
+            self._profile_record(result, 'unreachable')
+        if self.get_option('fleet_dir'):
+            self._fleet_event(result, 'unreachable')
+        super(CallbackModule, self).v2_runner_on_unreachable(result)
+
+    def v2_runner_item_on_ok(self, result):
+        if self._profile_enabled():
+            self._profile_record(result, 'ok', item=True)
+        if self.get_option('fleet_dir'):
+            self._fleet_event(result, 'ok', item=True)
+        super(CallbackModule, self).v2_runner_item_on_ok(result)
+
+    def v2_runner_item_on_failed(self, result):
+        if self._profile_enabled():
+            self._profile_record(result, 'failed', item=True)
+        if self.get_option('fleet_dir'):
+            self._fleet_event(result, 'failed', item=True)
+        super(CallbackModule, self).v2_runner_item_on_failed(result)
+
+    def v2_runner_item_on_skipped(self, result):
+        if self._profile_enabled():
+            self._profile_record(result, 'skipped', item=True)
+        if self.get_option('fleet_dir'):
+            self._fleet_event(result, 'skipped', item=True)
+        super(CallbackModule, self).v2_runner_item_on_skipped(result)
+
+    def v2_playbook_on_stats(self, stats):
+        super(CallbackModule, self).v2_playbook_on_stats(stats)
+        summary = dict((host, stats.summarize(host)) for host in sorted(stats.processed))
+        if self.get_option('fleet_dir'):
+            self._write_fleet_summary(summary)
+        if self.get_option('summary_file'):
+            self._write_summary(self.get_option('summary_file'), summary)
+        if not self._profile_enabled() or not self._profile_records:
+            return
+
+        top = self.get_option('profile_top')
+        tasks = [r for r in self._profile_records if r['item'] is None]
+        items = [r for r in self._profile_records if r['item'] is not None]
+        for title, records in (('SLOWEST TASKS', tasks), ('SLOWEST LOOP ITEMS', items)):
+            if not records:
+                continue
+            self._display.banner(title)
+            for record in sorted(records, key=lambda r: r['duration'], reverse=True)[:top]:
+                label = record['task'] if record['item'] is None else '%s (item=%s)' % (record['task'], record['item'])
+                self._display.display('%9.2fs  %-20s %s  [%s]' % (record['duration'], record['host'], label, record['path']))
+            self._display.display('')
+
+        output = self.get_option('profile_output')
+        if output:
+            self._write_profile(output)
+
+    def _write_profile(self, path):
+        try:
+            with open(path, 'w', newline='') as profile:
+                if path.endswith('.csv'):
+                    import csv
+
+                    writer = csv.DictWriter(profile, fieldnames=self.PROFILE_FIELDS)
+                    writer.writeheader()
+                    writer.writerows(self._profile_records)
+                else:
+                    json.dump(self._profile_records, profile, indent=2)
+        except OSError as e:
+            self._display.warning('Could not write task profile to %s: %s' % (path, to_text(e)))
+        else:
+            self._display.display('Task profile written to %s' % path)
 
     def _dump_results(self, result, indent=None, sort_keys=True, keep_invocation=False):
         if result.get('_ansible_no_log', False):
             return json.dumps(dict(censored="The output has been hidden due to the fact that 'no_log: true' was specified for this result"))
 
-        abridged_result = strip_internal_keys(module_response_deepcopy(result))
+        abridged_result = abridge_result(result)
 
         if not keep_invocation and self._display.verbosity < 3 and 'invocation' in result:
             del abridged_result['invocation']
@@ -107,12 +620,20 @@ class CallbackModule(Default):
         if 'stderr' in abridged_result and 'stderr_lines' in abridged_result:
             abridged_result['stderr_lines'] = '<omitted>'
 
+        max_field_size = self.get_option('max_field_size')
+        if max_field_size and max_field_size > 0:
+            abridged_result = elide_large_fields(abridged_result, max_field_size, self.get_option('spill_dir'))
+
+        output = IndentingWriter()
+        output.write(dumped)
+
         if abridged_result:
-            dumped += '\n'
-            dumped += to_text(yaml.dump(abridged_result, allow_unicode=True, width=1000, Dumper=ReadableDumper, default_flow_style=False))
+            output.write('\n')
+            dump_yaml(abridged_result, output)
 
-        dumped = '\n  '.join(dumped.split('\n')).rstrip()
-        return dumped
+        return output.getvalue().rstrip()
 
     def _serialize_diff(self, diff):
-        return to_text(yaml.dump(diff, allow_unicode=True, width=1000, Dumper=BaseDumper, default_flow_style=False))
+        import yaml
+
+        return to_text(yaml.dump(diff, allow_unicode=True, width=1000, Dumper=base_dumper(), default_flow_style=False))
@@ -0,0 +1,328 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Diff-and-apply Dock layout for tasks/dock.yml
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    module: dock_layout
+    author: mac-dev-playbook maintainers
+    short_description: Converge the Dock with one read, one plist write and one Dock restart
+    description:
+        - Reads C(persistent-apps) and C(persistent-others) of C(com.apple.dock) once, computes the minimal
+          list of additions, moves and removals against O(items), O(persist) and O(remove), and writes the
+          result back in a single update followed by a single C(killall Dock).
+        - Existing tiles are kept as they are (GUID, bookmark data), only their order changes; new tiles are
+          created like C(dockutil --add) does.
+        - Items are matched by path (C(file://) URL of the tile) or, for O(remove), by label as well.
+        - Applications (C(.app)) go to C(persistent-apps), other paths (folders) to C(persistent-others), unless
+          the item sets C(section).
+    options:
+      items:
+        description:
+          - The complete, ordered list of Dock items, each a dict with C(path) and optionally C(name) (label),
+            C(pos) (1-based; orders the items, list order otherwise) and C(section) (C(apps) or C(others)).
+            Other keys are ignored.
+          - Tiles not in the list are removed from both sections, like C(dockutil --remove all) did. Omit to
+            leave the other tiles alone.
+          - Paths may carry the shell quotes and a trailing C(--section <name>) of the dockutil based tasks
+            (C("/Applications/Open Umb.app"), C(~/Downloads --section others)); C(~) is expanded.
+        type: list
+        elements: dict
+      persist:
+        description:
+          - Items (same format as O(items)) that must be in the Dock, inserted at C(pos) within their section if
+            missing or elsewhere.
+          - An item that is also in O(items) keeps the position O(items) gives it, with a warning.
+        type: list
+        elements: dict
+        default: []
+      remove:
+        description: Labels or paths of tiles to remove.
+        type: list
+        elements: str
+        default: []
+      plist:
+        description:
+          - Read and write this plist file directly instead of going through C(defaults export/import).
+          - Meant for testing against fixture plists; the Dock is not restarted in this mode.
+        type: path
+      restart:
+        description: Restart the Dock (C(killall Dock)) after a change.
+        type: bool
+        default: true
+    notes:
+      - Supports check mode.
+'''
+
+EXAMPLES = '''
+- name: Configure the Dock
+  dock_layout:
+    items: "{{ dockitems }}"
+    persist: "{{ dockitems_persist }}"
+    remove: "{{ dockitems_remove }}"
+'''
+
+RETURN = '''
+edits:
+    description: The additions, moves and removals applied (or, in check mode, that would be applied).
+    returned: always
+    type: list
+    elements: dict
+    sample: [{"action": "add", "section": "persistent-apps", "label": "Safari", "position": 2}]
+apps:
+    description: Labels of C(persistent-apps) after the change.
+    returned: always
+    type: list
+    elements: str
+others:
+    description: Labels of C(persistent-others) after the change.
+    returned: always
+    type: list
+    elements: str
+'''
+
+import os
+import plistlib
+import random
+import re
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.common.text.converters import to_native
+from ansible.module_utils.six.moves.urllib.parse import quote, unquote
+
+DOMAIN = 'com.apple.dock'
+SECTIONS = ('persistent-apps', 'persistent-others')
+SECTION_NAMES = {'apps': 'persistent-apps', 'others': 'persistent-others'}
+SECTION_OPTION = re.compile(r'\s+--section\s+(\S+)\s*$')
+
+
+class DockLayoutError(Exception):
+    pass
+
+
+def clean_path(path):
+    """Strip the shell quoting of the dockutil tasks and any trailing slash, expand ~"""
+    path = path.strip()
+    if len(path) > 1 and path[0] == path[-1] and path[0] in '"\'':
+        path = path[1:-1]
+    return os.path.expanduser(path).rstrip('/') or '/'
+
+
+def tile_path(tile):
+    url = tile.get('tile-data', {}).get('file-data', {}).get('_CFURLString', '')
+    if url.startswith('file://'):
+        url = unquote(url[len('file://'):])
+    return clean_path(url) if url else None
+
+
+def tile_label(tile):
+    return tile.get('tile-data', {}).get('file-label')
+
+
+def section_for(path):
+    return 'persistent-apps' if path.endswith('.app') else 'persistent-others'
+
+
+def bundle_identifier(path):
+    try:
+        with open(os.path.join(path, 'Contents', 'Info.plist'), 'rb') as f:
+            return plistlib.load(f).get('CFBundleIdentifier')
+    except Exception:
+        return None
+
+
+def new_tile(path, label, section):
+    """A tile as dockutil --add creates it; the Dock fills in the bookmark data itself"""
+    url = 'file://' + quote(path) + '/'
+    if section == 'persistent-apps':
+        tile_data = {'file-data': {'_CFURLString': url, '_CFURLStringType': 15}, 'file-label': label, 'file-type': 41}
+        identifier = bundle_identifier(path)
+        if identifier:
+            tile_data['bundle-identifier'] = identifier
+        return {'GUID': random.randint(1, 2 ** 31 - 1), 'tile-type': 'file-tile', 'tile-data': tile_data}
+    tile_data = {'file-data': {'_CFURLString': url, '_CFURLStringType': 15}, 'file-label': label, 'file-type': 2,
+                 'arrangement': 1, 'displayas': 0, 'showas': 0}
+    return {'GUID': random.randint(1, 2 ** 31 - 1), 'tile-type': 'directory-tile', 'tile-data': tile_data}
+
+
+def normalize_items(items):
+    """(path, label, pos, section) per item, pos 1-based; items without pos keep their list order"""
+    normalized = []
+    for index, item in enumerate(items):
+        if not item.get('path'):
+            raise DockLayoutError('Dock item %r has no path' % (item,))
+        path, section = item['path'].strip(), item.get('section')
+        # dockutil arguments left in the path, e.g. "~/Downloads --section others"
+        match = SECTION_OPTION.search(path)
+        if match:
+            path, section = path[:match.start()], section or match.group(1)
+        path = clean_path(path)
+        if section is None:
+            section = section_for(path)
+        elif section in SECTION_NAMES:
+            section = SECTION_NAMES[section]
+        else:
+            raise DockLayoutError('Dock item %s has invalid section %r (apps or others)' % (path, section))
+        label = item.get('name') or os.path.splitext(os.path.basename(path))[0]
+        normalized.append((path, label, int(item.get('pos') or index + 1), section))
+    return normalized
+
+
+def longest_increasing(pairs):
+    """Longest subsequence of (position, index) pairs with increasing index"""
+    tails = []
+    previous = {}
+    for pair in pairs:
+        low, high = 0, len(tails)
+        while low < high:
+            middle = (low + high) // 2
+            if tails[middle][1] < pair[1]:
+                low = middle + 1
+            else:
+                high = middle
+        previous[pair] = tails[low - 1] if low else None
+        tails[low:low + 1] = [pair]
+    result = []
+    pair = tails[-1] if tails else None
+    while pair is not None:
+        result.append(pair)
+        pair = previous[pair]
+    return result[::-1]
+
+
+def target_layout(current, items, persist, remove):
+    """Wanted (path, label) per section, and the persist paths ignored because items places them"""
+    if items is not None:
+        target = dict((name, []) for name in SECTIONS)
+        for path, label, pos, section in sorted(normalize_items(items), key=lambda item: item[2]):
+            target[section].append((path, label))
+    else:
+        target = dict((name, [(tile_path(tile), tile_label(tile)) for tile in current[name]]) for name in SECTIONS)
+
+    placed = set(path for name in SECTIONS for path, label in target[name]) if items is not None else set()
+    ignored = []
+    for path, label, pos, section in sorted(normalize_items(persist), key=lambda item: item[2]):
+        if path in placed:
+            # items is the complete layout; a second position for the same tile would move it on every run
+            ignored.append(path)
+            continue
+        entries = [entry for entry in target[section] if entry[0] != path]
+        entries.insert(min(max(pos - 1, 0), len(entries)), (path, label))
+        target[section] = entries
+
+    removed = set(clean_path(r) if '/' in r or r.startswith('~') else r for r in remove)
+    for name in SECTIONS:
+        target[name] = [(path, label) for path, label in target[name] if path not in removed and label not in removed]
+    return target, ignored
+
+
+def plan_section(name, tiles, wanted):
+    """New tile list for one section and the edits turning tiles into it"""
+    edits = []
+    wanted_paths = set(path for path, label in wanted)
+    existing = {}
+    old_index = {}
+    for index, tile in enumerate(tiles):
+        path = tile_path(tile)
+        if path in wanted_paths and path not in existing:
+            existing[path] = tile
+            old_index[path] = index
+        else:
+            edits.append(dict(action='remove', section=name, label=tile_label(tile)))
+
+    new_tiles = []
+    for path, label in wanted:
+        if path in existing:
+            new_tiles.append(existing[path])
+        else:
+            new_tiles.append(new_tile(path, label, name))
+            edits.append(dict(action='add', section=name, label=label, position=len(new_tiles)))
+
+    # Tiles outside the longest run already in order are the ones that move
+    retained = [(position, old_index[path]) for position, (path, label) in enumerate(wanted, 1) if path in existing]
+    in_order = set(position for position, index in longest_increasing(retained))
+    for position, index in retained:
+        if position not in in_order:
+            edits.append(dict(action='move', section=name, label=tile_label(new_tiles[position - 1]),
+                              position=position))
+    return new_tiles, edits
+
+
+def plan_layout(dock, items=None, persist=(), remove=()):
+    """Return (new sections, edits, ignored persist paths); dock maps section name -> list of tiles"""
+    current = dict((name, list(dock.get(name) or [])) for name in SECTIONS)
+    target, ignored = target_layout(current, items, persist, remove)
+    sections = {}
+    edits = []
+    for name in SECTIONS:
+        sections[name], section_edits = plan_section(name, current[name], target[name])
+        edits.extend(section_edits)
+    return sections, edits, ignored
+
+
+class DockPreferences(object):
+    """Reads and writes com.apple.dock through defaults, or a plist file directly."""
+
+    def __init__(self, module, plist=None):
+        self.module = module
+        self.plist = plist
+
+    def read(self):
+        if self.plist:
+            with open(self.plist, 'rb') as f:
+                return plistlib.load(f)
+        defaults = self.module.get_bin_path('defaults', required=True)
+        rc, out, err = self.module.run_command([defaults, 'export', DOMAIN, '-'], binary_data=True, encoding=None)
+        if rc != 0:
+            raise DockLayoutError('Failed to export %s: %s' % (DOMAIN, to_native(err)))
+        return plistlib.loads(out) if out.strip() else {}
+
+    def write(self, values):
+        data = plistlib.dumps(values, fmt=plistlib.FMT_BINARY if self.plist else plistlib.FMT_XML)
+        if self.plist:
+            with open(self.plist, 'wb') as f:
+                f.write(data)
+            return
+        defaults = self.module.get_bin_path('defaults', required=True)
+        rc, out, err = self.module.run_command([defaults, 'import', DOMAIN, '-'], data=data, binary_data=True)
+        if rc != 0:
+            raise DockLayoutError('Failed to import %s: %s' % (DOMAIN, to_native(err)))
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            items=dict(type='list', elements='dict'),
+            persist=dict(type='list', elements='dict', default=[]),
+            remove=dict(type='list', elements='str', default=[]),
+            plist=dict(type='path'),
+            restart=dict(type='bool', default=True),
+        ),
+        supports_check_mode=True,
+    )
+
+    preferences = DockPreferences(module, module.params['plist'])
+    try:
+        dock = preferences.read()
+        sections, edits, ignored = plan_layout(dock, module.params['items'], module.params['persist'],
+                                               module.params['remove'])
+        for path in ignored:
+            module.warn('%s is in both items and persist; the position from items is used' % path)
+        if edits and not module.check_mode:
+            dock.update(sections)
+            preferences.write(dock)
+            if module.params['restart'] and not module.params['plist']:
+                module.run_command(['killall', 'Dock'])
+    except (DockLayoutError, ValueError, plistlib.InvalidFileException) as e:
+        module.fail_json(msg=to_native(e))
+    except (IOError, OSError) as e:
+        module.fail_json(msg='Failed to update the Dock: %s' % to_native(e))
+
+    module.exit_json(changed=bool(edits), edits=edits, apps=[tile_label(tile) for tile in sections['persistent-apps']],
+                     others=[tile_label(tile) for tile in sections['persistent-others']])
+
+
+if __name__ == '__main__':
+    main()
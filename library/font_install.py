@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Indexed font installation for tasks/fonts.yml
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    module: font_install
+    author: mac-dev-playbook maintainers
+    short_description: Install font files that are missing or changed, from one scan of the font directories
+    description:
+        - Scans the target directory and O(index_dirs) once into a name index, collects the font files of all
+          O(sources) and copies only those that are missing in O(dest) or differ from the installed file.
+        - Installed files keep the modification time of their source, so a converged font is recognised by
+          size and mtime alone. Files of equal size but different mtime are compared by SHA-1 once and, if
+          identical, get the source mtime so the next run does not hash them again.
+        - O(families) reports whether font families installed by other means (downloads) are present, from
+          the same index.
+    options:
+      sources:
+        description:
+          - Directories on the target with font files, each a dict with C(path) and optionally C(recurse)
+            (default C(false)) and C(optional) (default C(false)).
+          - A directory that does not exist fails the task, unless it is C(optional); then it is skipped.
+          - If several sources contain a file with the same name, the last one wins.
+        type: list
+        elements: dict
+        default: []
+      patterns:
+        description: Shell patterns selecting the font files in O(sources).
+        type: list
+        elements: str
+        default: ['*.ttf', '*.otf', '*.TTF', '*.OTF']
+      dest:
+        description: Directory the fonts are installed to; created if needed.
+        type: path
+        required: true
+      mode:
+        description: Permissions of installed font files.
+        type: raw
+        default: '0644'
+      index_dirs:
+        description: Further font directories indexed for O(families), for example C(~/Library/Fonts).
+        type: list
+        elements: path
+        default: []
+      families:
+        description: Map of a name to a shell pattern; the result tells for each name whether a matching file exists.
+        type: dict
+        default: {}
+    notes:
+      - Supports check mode.
+'''
+
+EXAMPLES = '''
+- name: Install fonts
+  font_install:
+    sources:
+      - path: "{{ fonts_common_dir }}"
+    patterns: "{{ fonts_extensions }}"
+    dest: /Library/Fonts
+    families:
+      hack: HackNerdFont*
+  register: fonts
+'''
+
+RETURN = '''
+installed:
+    description: Font files that were (or in check mode would have been) copied, with the reason.
+    returned: always
+    type: list
+    elements: dict
+    sample: [{"name": "Roboto-Regular.ttf", "src": "/repo/files/fonts/common/Roboto-Regular.ttf", "reason": "missing"}]
+unchanged:
+    description: Number of font files already installed.
+    returned: always
+    type: int
+families:
+    description: For every name in O(families), whether a matching font file exists.
+    returned: always
+    type: dict
+    sample: {"hack": true}
+'''
+
+import fnmatch
+import hashlib
+import os
+import shutil
+import tempfile
+
+from collections import OrderedDict
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.common.text.converters import to_native
+
+
+class FontInstallError(Exception):
+    pass
+
+
+def scan_dir(path):
+    """Map of file name -> os.stat_result of the regular files in path"""
+    index = {}
+    try:
+        entries = list(os.scandir(path))
+    except (IOError, OSError):
+        return index
+    for entry in entries:
+        if entry.is_file():
+            index[entry.name] = entry.stat()
+    return index
+
+
+def find_fonts(sources, patterns):
+    """Ordered map of file name -> source path over all sources"""
+    fonts = OrderedDict()
+    for source in sources:
+        root = os.path.expanduser(source['path'])
+        if not os.path.isdir(root):
+            if source.get('optional'):
+                continue
+            raise FontInstallError('Font source %s does not exist on the target' % root)
+        if source.get('recurse'):
+            walk = ((directory, files) for directory, dirs, files in os.walk(root))
+        else:
+            walk = [(root, [name for name in os.listdir(root) if os.path.isfile(os.path.join(root, name))])]
+        for directory, files in walk:
+            for name in sorted(files):
+                if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns):
+                    fonts[name] = os.path.join(directory, name)
+    return fonts
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compare(src, dest, installed, check_mode):
+    """None if dest already holds src, else the reason it has to be copied"""
+    if installed is None:
+        return 'missing'
+    st = os.stat(src)
+    if st.st_size != installed.st_size:
+        return 'changed'
+    if int(st.st_mtime) == int(installed.st_mtime):
+        return None
+    if file_sha1(src) != file_sha1(dest):
+        return 'changed'
+    if not check_mode:
+        # Same content: adopt the source mtime so the next run needs no hashing
+        os.utime(dest, (installed.st_atime, st.st_mtime))
+    return None
+
+
+def install(src, dest, mode):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), prefix='.font_install')
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp)
+        shutil.copystat(src, tmp)
+        os.chmod(tmp, mode)
+        os.replace(tmp, dest)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            sources=dict(type='list', elements='dict', default=[]),
+            patterns=dict(type='list', elements='str', default=['*.ttf', '*.otf', '*.TTF', '*.OTF']),
+            dest=dict(type='path', required=True),
+            mode=dict(type='raw', default='0644'),
+            index_dirs=dict(type='list', elements='path', default=[]),
+            families=dict(type='dict', default={}),
+        ),
+        supports_check_mode=True,
+    )
+
+    dest = module.params['dest']
+    mode = module.params['mode']
+    mode = int(mode, 8) if isinstance(mode, str) else int(mode)
+
+    index = scan_dir(dest)
+    names = set(index)
+    for directory in module.params['index_dirs']:
+        names.update(scan_dir(directory))
+
+    installed = []
+    unchanged = 0
+    try:
+        for name, src in find_fonts(module.params['sources'], module.params['patterns']).items():
+            target = os.path.join(dest, name)
+            reason = compare(src, target, index.get(name), module.check_mode)
+            if reason is None:
+                unchanged += 1
+                continue
+            installed.append(dict(name=name, src=src, reason=reason))
+            names.add(name)
+        if installed and not module.check_mode:
+            if not os.path.isdir(dest):
+                os.makedirs(dest, 0o755)
+            for font in installed:
+                install(font['src'], os.path.join(dest, font['name']), mode)
+    except FontInstallError as e:
+        module.fail_json(msg=to_native(e))
+    except (IOError, OSError) as e:
+        module.fail_json(msg='Failed to install fonts to %s: %s' % (dest, to_native(e)), installed=installed)
+
+    families = dict((family, any(fnmatch.fnmatchcase(name, pattern) for name in names))
+                    for family, pattern in module.params['families'].items())
+    module.exit_json(changed=bool(installed), installed=installed, unchanged=unchanged, families=families)
+
+
+if __name__ == '__main__':
+    main()
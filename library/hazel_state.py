@@ -0,0 +1,251 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Deduplicated Hazel configuration snapshots and rule deployment plan for tasks/post/hazel.yml
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    module: hazel_state
+    author: mac-dev-playbook maintainers
+    short_description: Snapshot the Hazel configuration into a content-addressed store and plan the rule deployment
+    description:
+        - Hashes the files below O(path) (SHA-1) and compares the rules of O(rules) with the installed files, so only
+          rules whose content differs have to be deployed.
+        - Hashes are cached in O(backup_dir) by size and modification time; on a converged machine no file content is
+          read.
+        - If the configuration differs from the last snapshot, a new snapshot is taken in
+          C(<backup_dir>/snapshots/<timestamp>/). Every file of a snapshot is a hardlink to a read-only blob in
+          C(<backup_dir>/objects/), so unchanged files take no additional space. Only the newest O(keep)
+          snapshots are kept; blobs no snapshot refers to any more are removed.
+    options:
+      path:
+        description: The Hazel configuration directory.
+        type: path
+        required: true
+      rules:
+        description:
+          - Rule files to deploy, each a dict with C(path) and C(checksum) (SHA-1), as returned by
+            M(ansible.builtin.find) with C(get_checksum=true). Other keys are ignored.
+          - A rule is installed as O(prefix) plus the file name of C(path).
+        type: list
+        elements: dict
+        default: []
+      prefix:
+        description: Prefix of the installed rule files (the volume UUID prefix Hazel uses).
+        type: str
+        default: ''
+      backup_dir:
+        description: Directory holding the snapshots, the blob store and the hash cache.
+        type: path
+        required: true
+      backup:
+        description: Take a snapshot if the configuration changed since the last one.
+        type: bool
+        default: true
+      keep:
+        description: Number of snapshots to keep; C(0) keeps all.
+        type: int
+        default: 10
+    notes:
+      - Supports check mode.
+      - To restore a snapshot, copy its files back, e.g. C(cp -p <backup_dir>/snapshots/<timestamp>/* <path>/).
+'''
+
+EXAMPLES = '''
+- name: Snapshot Hazel configuration and plan rule deployment
+  hazel_state:
+    path: "{{ myhomedir }}/Library/Application Support/Hazel"
+    rules: "{{ hazel_rules_found.files }}"
+    prefix: "{{ volume_uuid.stdout }}-"
+    backup_dir: "{{ myhomedir }}/Library/Application Support/Hazel.backups"
+  register: hazel_state
+'''
+
+RETURN = '''
+deploy:
+    description: C(path) of every rule in O(rules) that is missing or differs in O(path).
+    returned: always
+    type: list
+    elements: str
+snapshot:
+    description: Directory of the snapshot taken by this run, or null.
+    returned: always
+    type: str
+pruned:
+    description: Snapshots removed by the retention policy.
+    returned: always
+    type: list
+    elements: str
+files:
+    description: Number of files in the Hazel configuration.
+    returned: always
+    type: int
+'''
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.common.text.converters import to_native
+
+INDEX = 'index.json'
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_index(path):
+    try:
+        with open(path) as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError):
+        return dict(files={}, snapshot={})
+    return dict(files=index.get('files', {}), snapshot=index.get('snapshot', {}))
+
+
+def save_index(path, index):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.hazel_state')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def manifest(root, cache):
+    """Map of relative path -> SHA-1 of the files below root; only files whose size or mtime changed are read"""
+    files = {}
+    hashed = {}
+    for directory, dirs, names in os.walk(root):
+        dirs.sort()
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            rel = os.path.relpath(path, root)
+            st = os.stat(path)
+            key = [st.st_size, st.st_mtime_ns]
+            entry = cache.get(rel)
+            if entry and entry[:2] == key:
+                files[rel] = entry[2]
+            else:
+                files[rel] = file_sha1(path)
+            hashed[rel] = key + [files[rel]]
+    return files, hashed
+
+
+def store_blob(objects, root, rel, sha1):
+    blob = os.path.join(objects, sha1[:2], sha1[2:])
+    if not os.path.exists(blob):
+        if not os.path.isdir(os.path.dirname(blob)):
+            os.makedirs(os.path.dirname(blob))
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(blob), prefix='.blob')
+        os.close(fd)
+        shutil.copy2(os.path.join(root, rel), tmp)
+        if file_sha1(tmp) != sha1:
+            # Changed while we were looking; the next run picks it up
+            os.unlink(tmp)
+            return None
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, blob)
+    return blob
+
+
+def take_snapshot(backup_dir, root, files):
+    objects = os.path.join(backup_dir, 'objects')
+    snapshots = os.path.join(backup_dir, 'snapshots')
+    stamp = time.strftime('%Y%m%dT%H%M%S')
+    target = os.path.join(snapshots, stamp)
+    suffix = 1
+    while os.path.exists(target):
+        suffix += 1
+        target = os.path.join(snapshots, '%s-%d' % (stamp, suffix))
+    tmp = os.path.join(snapshots, '.' + os.path.basename(target))
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    stored = {}
+    for rel, sha1 in sorted(files.items()):
+        blob = store_blob(objects, root, rel, sha1)
+        if blob is None:
+            continue
+        link = os.path.join(tmp, rel)
+        if not os.path.isdir(os.path.dirname(link)):
+            os.makedirs(os.path.dirname(link))
+        os.link(blob, link)
+        stored[rel] = sha1
+    os.rename(tmp, target)
+    return target, stored
+
+
+def prune(backup_dir, keep):
+    """Remove all but the newest keep snapshots, then the blobs only the store itself still links to"""
+    snapshots = os.path.join(backup_dir, 'snapshots')
+    names = sorted(name for name in os.listdir(snapshots) if not name.startswith('.'))
+    pruned = names[:-keep] if keep and len(names) > keep else []
+    for name in pruned:
+        shutil.rmtree(os.path.join(snapshots, name))
+    if pruned:
+        objects = os.path.join(backup_dir, 'objects')
+        for directory, dirs, blobs in os.walk(objects):
+            for blob in blobs:
+                path = os.path.join(directory, blob)
+                if os.stat(path).st_nlink == 1:
+                    os.unlink(path)
+    return pruned
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            path=dict(type='path', required=True),
+            rules=dict(type='list', elements='dict', default=[]),
+            prefix=dict(type='str', default=''),
+            backup_dir=dict(type='path', required=True),
+            backup=dict(type='bool', default=True),
+            keep=dict(type='int', default=10),
+        ),
+        supports_check_mode=True,
+    )
+
+    root = module.params['path']
+    backup_dir = module.params['backup_dir']
+    index_path = os.path.join(backup_dir, INDEX)
+    index = load_index(index_path)
+
+    snapshot = None
+    pruned = []
+    try:
+        files, hashed = manifest(root, index['files']) if os.path.isdir(root) else ({}, {})
+        deploy = []
+        for rule in module.params['rules']:
+            if not rule.get('path') or not rule.get('checksum'):
+                module.fail_json(msg='Rule %r needs path and checksum (find with get_checksum: true)' % (rule,))
+            if files.get(module.params['prefix'] + os.path.basename(rule['path'])) != rule['checksum']:
+                deploy.append(rule['path'])
+
+        if not module.check_mode:
+            if not os.path.isdir(backup_dir):
+                os.makedirs(backup_dir, 0o700)
+            if module.params['backup'] and files and files != index['snapshot']:
+                snapshot, index['snapshot'] = take_snapshot(backup_dir, root, files)
+                pruned = prune(backup_dir, module.params['keep'])
+            if snapshot or hashed != index['files']:
+                index['files'] = hashed
+                save_index(index_path, index)
+    except (IOError, OSError) as e:
+        module.fail_json(msg='Failed to snapshot %s: %s' % (root, to_native(e)))
+
+    module.exit_json(changed=snapshot is not None, deploy=deploy, snapshot=snapshot, pruned=pruned, files=len(files))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Batch unloading of the unwanted LaunchAgents/LaunchDaemons lists
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    module: launchagents_batch
+    author: mac-dev-playbook maintainers
+    short_description: Unload a list of LaunchAgents and LaunchDaemons with one launchctl snapshot
+    description:
+        - Takes the whole list of unwanted agents, captures C(launchctl list) once (the system domain and, when
+          run through sudo, the domain of the invoking user), parses it into a set of loaded labels and unloads
+          only the loaded agents, with a single C(launchctl unload) per domain.
+        - Each agent is a plist path or a bare label. Bare labels are skipped (C(status=skipped)), like the
+          per-agent tasks did, unless O(resolve_labels) is set; then they are looked up as C(<label>.plist) in
+          O(search_dirs).
+        - The label of an agent is read from its plist (C(Label)), falling back to the file name.
+    options:
+      agents:
+        description: Plist paths or labels of the agents to unload.
+        type: list
+        elements: str
+        required: true
+      disable:
+        description: Also mark the agents disabled (C(launchctl unload -w)), so they stay unloaded after a reboot.
+        type: bool
+        default: false
+      resolve_labels:
+        description:
+          - Look up agents given as a bare label in O(search_dirs) and unload them.
+          - Off by default; the bare labels of C(launch_agents_to_disable) are MDM-managed agents that were never
+            unloaded.
+        type: bool
+        default: false
+      search_dirs:
+        description: Directories searched for agents given as a bare label, with O(resolve_labels).
+        type: list
+        elements: str
+        default: ['~/Library/LaunchAgents', '/Library/LaunchAgents', '/Library/LaunchDaemons']
+    notes:
+      - Supports check mode.
+      - Run with C(become) so system daemons can be unloaded; C(~) in O(search_dirs) is expanded for the user
+        that invoked sudo.
+      - Agents that are still loaded after the unload are reported (C(status=still loaded)) with a warning
+        instead of failing the task.
+'''
+
+EXAMPLES = '''
+- name: Unload unwanted LaunchAgents
+  launchagents_batch:
+    agents: "{{ unload_launchagents + private_mac_launchagents | default([]) }}"
+  become: true
+'''
+
+RETURN = '''
+agents:
+    description: One entry per requested agent.
+    returned: always
+    type: list
+    elements: dict
+    sample: [{"agent": "/Library/LaunchAgents/org.gpgtools.updater.plist", "label": "org.gpgtools.updater",
+              "path": "/Library/LaunchAgents/org.gpgtools.updater.plist", "status": "unloaded", "changed": true}]
+'''
+
+import os
+import plistlib
+import pwd
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.common.text.converters import to_native
+
+MISSING = 'missing'
+SKIPPED = 'skipped'
+NOT_LOADED = 'not loaded'
+UNLOADED = 'unloaded'
+STILL_LOADED = 'still loaded'
+
+
+def parse_launchctl_list(output):
+    """Set of labels from `launchctl list` output (PID, status and label columns)"""
+    labels = set()
+    for line in output.splitlines()[1:]:
+        parts = line.split(None, 2)
+        if len(parts) == 3:
+            labels.add(parts[2].strip())
+    return labels
+
+
+def invoking_user():
+    """(uid, home) of the user that ran sudo, or of the current user"""
+    uid = int(os.environ.get('SUDO_UID', os.getuid()))
+    try:
+        return uid, pwd.getpwuid(uid).pw_dir
+    except KeyError:
+        return uid, os.path.expanduser('~')
+
+
+def launchctl_domains(launchctl, uid):
+    """Command prefixes reaching each launchd domain: the current one and, as root under sudo, the user's"""
+    domains = [[launchctl]]
+    if os.getuid() == 0 and uid != 0:
+        domains.append([launchctl, 'asuser', str(uid), launchctl])
+    return domains
+
+
+def loaded_labels(module, domains):
+    """Map of loaded label -> index of the first domain listing it"""
+    labels = {}
+    for index, prefix in enumerate(domains):
+        cmd = prefix + ['list']
+        rc, out, err = module.run_command(cmd)
+        if rc != 0:
+            module.fail_json(msg='%s failed: %s' % (' '.join(cmd), to_native(err).strip()))
+        for label in parse_launchctl_list(out):
+            labels.setdefault(label, index)
+    return labels
+
+
+def file_label(path):
+    name = os.path.basename(path)
+    return name[:-len('.plist')] if name.endswith('.plist') else name
+
+
+def plist_label(path):
+    try:
+        with open(path, 'rb') as f:
+            label = plistlib.load(f).get('Label')
+    except Exception:
+        label = None
+    return label or file_label(path)
+
+
+def expand_home(path, home):
+    return home + path[1:] if path.startswith('~') else path
+
+
+def is_bare_label(agent):
+    return '/' not in agent and not agent.endswith('.plist')
+
+
+def resolve(agent, search_dirs, home):
+    """(path or None, label) of an agent given as a plist path or a bare label"""
+    if not is_bare_label(agent):
+        path = expand_home(agent, home)
+        return (path, plist_label(path)) if os.path.isfile(path) else (None, file_label(path))
+    for directory in search_dirs:
+        path = os.path.join(directory, agent + '.plist')
+        if os.path.isfile(path):
+            return path, plist_label(path)
+    return None, agent
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            agents=dict(type='list', elements='str', required=True),
+            disable=dict(type='bool', default=False),
+            resolve_labels=dict(type='bool', default=False),
+            search_dirs=dict(type='list', elements='str',
+                             default=['~/Library/LaunchAgents', '/Library/LaunchAgents', '/Library/LaunchDaemons']),
+        ),
+        supports_check_mode=True,
+    )
+
+    launchctl = module.get_bin_path('launchctl', required=True)
+    uid, home = invoking_user()
+    search_dirs = [expand_home(d, home) for d in module.params['search_dirs']]
+    domains = launchctl_domains(launchctl, uid)
+    loaded = loaded_labels(module, domains)
+
+    results = []
+    # Paths to unload per domain, so each domain gets a single launchctl unload
+    to_unload = [[] for _ in domains]
+    for agent in module.params['agents']:
+        if is_bare_label(agent) and not module.params['resolve_labels']:
+            results.append(dict(agent=agent, label=agent, path=None, status=SKIPPED, changed=False))
+            continue
+        path, label = resolve(agent, search_dirs, home)
+        if path is None:
+            status = MISSING
+        elif label not in loaded:
+            status = NOT_LOADED
+        else:
+            status = UNLOADED
+            if path not in to_unload[loaded[label]]:
+                to_unload[loaded[label]].append(path)
+        results.append(dict(agent=agent, label=label, path=path, status=status, changed=status == UNLOADED))
+
+    if any(to_unload) and not module.check_mode:
+        errors = []
+        for prefix, paths in zip(domains, to_unload):
+            if paths:
+                rc, out, err = module.run_command(prefix + ['unload'] + (['-w'] if module.params['disable'] else [])
+                                                  + paths)
+                errors.append(to_native(err or out).strip())
+        # launchctl unload keeps going after a failing path, so check the outcome per label
+        still_loaded = loaded_labels(module, domains)
+        for result in results:
+            if result['status'] == UNLOADED and result['label'] in still_loaded:
+                result.update(status=STILL_LOADED, changed=False)
+                module.warn('%s is still loaded after launchctl unload: %s'
+                            % (result['label'], ' '.join(e for e in errors if e)))
+
+    module.exit_json(changed=any(r['changed'] for r in results), agents=results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Batch variant of community.general.osx_defaults for the playbook's `defaults` list
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    module: osx_defaults_batch
+    author: mac-dev-playbook maintainers
+    short_description: Apply a list of macOS defaults with one read and at most one write per domain
+    description:
+        - Takes the whole C(defaults) list used by C(tasks/post/various-settings.yml), groups it by domain,
+          reads every domain once with C(defaults export), compares the wanted values in-process and writes
+          the changed keys back with a single C(defaults import) per domain.
+        - Value and type handling follows M(community.general.osx_defaults).
+    options:
+      settings:
+        description:
+          - List of settings, each a dict with C(domain), C(key), C(value) and optionally C(type) (default C(string))
+            and C(host) (C(currentHost) or a host name).
+          - Other keys such as C(name) or C(become) are ignored.
+        type: list
+        elements: dict
+        required: true
+      snapshot_cache:
+        description:
+          - JSON file remembering, per domain, the size, mtime and SHA-256 of its plist and a hash of the settings
+            last converged for it.
+          - A domain whose plist and wanted settings are unchanged since the last run that found it converged is
+            skipped without running C(defaults export).
+          - A domain is only recorded once its plist file holds the wanted values, so a write cfprefsd has not
+            flushed yet is read again by the next run.
+          - Caching is disabled when omitted.
+        type: path
+      force:
+        description: Evaluate every domain even if O(snapshot_cache) says it is converged.
+        type: bool
+        default: false
+    notes:
+      - Supports check mode.
+      - A domain is written back as a whole, so keys changed by other processes between the read and the
+        write of that domain would be lost; the window is a few milliseconds.
+'''
+
+EXAMPLES = '''
+- name: Set macOS default settings
+  osx_defaults_batch:
+    settings: "{{ defaults }}"
+'''
+
+RETURN = '''
+settings:
+    description: One entry per requested setting with its previous value and whether it changed.
+    returned: always
+    type: list
+    elements: dict
+    sample: [{"domain": "com.apple.dock", "key": "tilesize", "before": 48, "after": 32, "changed": true}]
+changed_domains:
+    description: Domains that were (or in check mode would have been) written.
+    returned: always
+    type: list
+    elements: str
+cached_domains:
+    description: Domains skipped because O(snapshot_cache) showed them converged.
+    returned: always
+    type: list
+    elements: str
+'''
+
+import glob
+import hashlib
+import json
+import os
+import plistlib
+import tempfile
+
+from collections import OrderedDict
+from datetime import datetime
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.common.text.converters import to_native
+
+TRUE_VALUES = ('true', 'yes', 'on', '1')
+FALSE_VALUES = ('false', 'no', 'off', '0')
+
+
+class OSXDefaultsBatchError(Exception):
+    pass
+
+
+def convert_value(value, value_type):
+    """Convert ``value`` to the Python type plistlib uses for ``value_type`` (osx_defaults semantics)."""
+    if value_type in ('bool', 'boolean'):
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() in TRUE_VALUES:
+            return True
+        if str(value).lower() in FALSE_VALUES:
+            return False
+        raise OSXDefaultsBatchError('Invalid boolean value: %r' % (value,))
+    if value_type in ('int', 'integer'):
+        return int(value)
+    if value_type == 'float':
+        return float(value)
+    if value_type == 'date':
+        return value if isinstance(value, datetime) else datetime.strptime(str(value).split('+')[0].strip(), '%Y-%m-%d %H:%M:%S')
+    if value_type == 'array':
+        # osx_defaults passes array elements on the command line, so they are stored as strings
+        return [str(v) for v in value] if isinstance(value, (list, tuple)) else [str(value)]
+    if value_type == 'dict':
+        if not isinstance(value, dict):
+            raise OSXDefaultsBatchError('Invalid dict value: %r' % (value,))
+        return value
+    if value_type == 'string':
+        return str(value)
+    raise OSXDefaultsBatchError('Unsupported type: %s' % value_type)
+
+
+def same_value(current, wanted):
+    """Compare plist values by type as well, so a stored 1 does not satisfy True or 1.0."""
+    if type(current) is not type(wanted):
+        return False
+    if isinstance(wanted, list):
+        return len(current) == len(wanted) and all(same_value(c, w) for c, w in zip(current, wanted))
+    if isinstance(wanted, dict):
+        return set(current) == set(wanted) and all(same_value(current[k], wanted[k]) for k in wanted)
+    return current == wanted
+
+
+def printable(value):
+    """Make plist values that JSON cannot carry readable in the module result."""
+    if isinstance(value, bytes):
+        return '<data: %d bytes>' % len(value)
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, list):
+        return [printable(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, printable(v)) for k, v in value.items())
+    return value
+
+
+def group_by_domain(settings):
+    """Group settings by (domain, host), keeping their order."""
+    groups = OrderedDict()
+    for setting in settings:
+        for required in ('domain', 'key', 'value'):
+            if required not in setting:
+                raise OSXDefaultsBatchError('Setting %r is missing %s' % (setting, required))
+        groups.setdefault((setting['domain'], setting.get('host')), []).append(setting)
+    return groups
+
+
+class DefaultsDomain(object):
+    """Reads and writes one preferences domain through the defaults command."""
+
+    def __init__(self, module, executable, domain, host=None):
+        self.module = module
+        self.domain = domain
+        self.base_cmd = [executable]
+        if host == 'currentHost':
+            self.base_cmd.append('-currentHost')
+        elif host:
+            self.base_cmd.extend(['-host', host])
+
+    def read(self):
+        rc, out, err = self.module.run_command(self.base_cmd + ['export', self.domain, '-'], binary_data=True, encoding=None)
+        if rc != 0:
+            raise OSXDefaultsBatchError('Failed to export %s: %s' % (self.domain, to_native(err)))
+        if not out.strip():
+            return {}
+        return plistlib.loads(out)
+
+    def write(self, values):
+        data = plistlib.dumps(values, fmt=plistlib.FMT_XML, sort_keys=False)
+        rc, out, err = self.module.run_command(self.base_cmd + ['import', self.domain, '-'], data=data, binary_data=True)
+        if rc != 0:
+            raise OSXDefaultsBatchError('Failed to import %s: %s' % (self.domain, to_native(err)))
+
+
+def plist_path(domain, host=None):
+    """Return the file backing ``domain`` for the current user, or None if it cannot be located."""
+    preferences = os.path.expanduser('~/Library/Preferences')
+    if os.path.isabs(domain):
+        return domain if domain.endswith('.plist') else domain + '.plist'
+    name = '.GlobalPreferences' if domain in ('NSGlobalDomain', '-g', '-globalDomain') else domain
+    if host == 'currentHost':
+        matches = glob.glob(os.path.join(preferences, 'ByHost', glob.escape(name) + '.*.plist'))
+        return matches[0] if len(matches) == 1 else None
+    if host:
+        return None
+    return os.path.join(preferences, name + '.plist')
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def settings_hash(group):
+    wanted = [(s['key'], s.get('type') or 'string', s['value']) for s in group]
+    return hashlib.sha256(json.dumps(wanted, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def file_converged(path, group):
+    """True if the plist file at ``path`` itself holds every wanted value of ``group``."""
+    if path is None or not os.path.isfile(path):
+        return False
+    try:
+        with open(path, 'rb') as f:
+            values = plistlib.load(f)
+    except (ValueError, plistlib.InvalidFileException):
+        return False
+    return all(setting['key'] in values and
+               same_value(values[setting['key']], convert_value(setting['value'], setting.get('type') or 'string'))
+               for setting in group)
+
+
+class SnapshotCache(object):
+    """Remembers which domains were converged, keyed on their plist's stat and content hash."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                self.entries = {}
+            if not isinstance(self.entries, dict):
+                self.entries = {}
+
+    @staticmethod
+    def snapshot(path):
+        if path is None or not os.path.isfile(path):
+            return None
+        st = os.stat(path)
+        return dict(size=st.st_size, mtime=st.st_mtime)
+
+    def is_converged(self, key, path, wanted_hash):
+        entry = self.entries.get(key)
+        snapshot = self.snapshot(path)
+        if not isinstance(entry, dict) or snapshot is None or entry.get('settings') != wanted_hash:
+            return False
+        if entry.get('size') == snapshot['size'] and entry.get('mtime') == snapshot['mtime']:
+            return True
+        # Touched but maybe not modified (cfprefsd rewrites files): compare content before re-reading the domain
+        if entry.get('size') == snapshot['size'] and entry.get('sha256') == file_sha256(path):
+            entry.update(snapshot)
+            self.dirty = True
+            return True
+        return False
+
+    def record(self, key, path, wanted_hash):
+        snapshot = self.snapshot(path)
+        if snapshot is None:
+            self.forget(key)
+            return
+        snapshot.update(sha256=file_sha256(path), settings=wanted_hash)
+        self.entries[key] = snapshot
+        self.dirty = True
+
+    def forget(self, key):
+        if self.entries.pop(key, None) is not None:
+            self.dirty = True
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        directory = os.path.dirname(self.path) or '.'
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.osx_defaults_snapshots')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def apply_settings(module, executable, settings, check_mode=False, cache=None, force=False):
+    results = []
+    changed_domains = []
+    cached_domains = []
+    for (domain, host), group in group_by_domain(settings).items():
+        path = plist_path(domain, host)
+        cache_key = '%s:%s:%s' % (os.path.expanduser('~'), host or '', domain)
+        wanted_hash = settings_hash(group)
+        if cache is not None and not force and cache.is_converged(cache_key, path, wanted_hash):
+            cached_domains.append(domain)
+            results.extend(dict(domain=domain, key=setting['key'], changed=False, cached=True) for setting in group)
+            continue
+
+        defaults_domain = DefaultsDomain(module, executable, domain, host)
+        current = defaults_domain.read()
+        domain_changed = False
+        for setting in group:
+            wanted = convert_value(setting['value'], setting.get('type') or 'string')
+            before = current.get(setting['key'])
+            changed = setting['key'] not in current or not same_value(before, wanted)
+            if changed:
+                current[setting['key']] = wanted
+                domain_changed = True
+            results.append(dict(domain=domain, key=setting['key'], before=printable(before), after=printable(wanted),
+                                changed=changed))
+        if domain_changed:
+            changed_domains.append(domain)
+            if not check_mode:
+                defaults_domain.write(current)
+        if cache is None or check_mode:
+            continue
+        # cfprefsd flushes imports to the plist later, so right after a write (and on the next run, which
+        # reads the values back from cfprefsd) the file may still hold the old values. Recording such a
+        # file would skip the domain for good if the write never landed.
+        if file_converged(path, group):
+            cache.record(cache_key, path, wanted_hash)
+        else:
+            cache.forget(cache_key)
+    return results, changed_domains, cached_domains
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            settings=dict(type='list', elements='dict', required=True),
+            snapshot_cache=dict(type='path'),
+            force=dict(type='bool', default=False),
+        ),
+        supports_check_mode=True,
+    )
+
+    executable = module.get_bin_path('defaults', required=True)
+    cache = SnapshotCache(module.params['snapshot_cache']) if module.params['snapshot_cache'] else None
+    try:
+        results, changed_domains, cached_domains = apply_settings(module, executable, module.params['settings'],
+                                                                  module.check_mode, cache, module.params['force'])
+        if cache is not None:
+            cache.save()
+    except (OSXDefaultsBatchError, ValueError, plistlib.InvalidFileException) as e:
+        module.fail_json(msg=to_native(e))
+    except (IOError, OSError) as e:
+        module.fail_json(msg='Failed to update snapshot cache %s: %s' % (module.params['snapshot_cache'], to_native(e)))
+
+    module.exit_json(changed=bool(changed_domains), settings=results, changed_domains=changed_domains,
+                     cached_domains=cached_domains)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,401 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Batch installer for the global Composer/npm/pip/gem/uv package lists of tasks/extra-packages.yml
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    module: package_batch
+    author: mac-dev-playbook maintainers
+    short_description: Converge a list of global packages with one query and one install per package manager
+    description:
+        - Takes a whole package list (C(composer_packages), C(npm_packages), C(pip_packages), C(gem_packages) or
+          C(uv_packages)), reads the installed packages of the manager once, and installs, upgrades or removes
+          only what differs, with one command per action instead of one module run per package.
+        - Outdated packages are only queried when some package has O(packages[].state=latest).
+        - After a change the installed set is read once more, so every package still reports its own
+          C(before)/C(after) version and C(changed) flag.
+    options:
+      manager:
+        description: Package manager the list belongs to.
+        type: str
+        required: true
+        choices: [composer, npm, pip, gem, uv]
+      packages:
+        description:
+          - Package names, or dicts with C(name) and optionally C(state) (C(present), C(latest) or C(absent);
+            default C(present)), C(version) and C(executable).
+          - Packages with a different C(executable) are handled as a separate batch.
+        type: list
+        elements: raw
+        required: true
+      executable:
+        description: Default executable of the manager (C(pip3) for pip, the manager's name otherwise).
+        type: str
+    notes:
+      - Supports check mode.
+      - An exact C(version) (for example C(1.2.3)) must match the installed version; a range such as C(^2.6) or
+        C(~> 1.15) is passed to the manager on install but any installed version is considered to satisfy it,
+        like the per-package C(npm) and C(gem) modules did.
+      - uv has no outdated query, so C(latest) uv tools are always handed to one C(uv tool upgrade).
+      - Each batch is one command, so a single package that cannot be installed (unknown name, unresolvable
+        version) fails the whole batch and the task, where the per-package loop failed only that item and went
+        on with the rest. The error message names the failed command and quotes the manager's output.
+      - C(scripts/bench-package-batch.py) compares this module with one run per package.
+'''
+
+EXAMPLES = '''
+- name: Install global NPM packages.
+  package_batch:
+    manager: npm
+    packages: "{{ npm_packages }}"
+  when: npm_packages | length > 0
+'''
+
+RETURN = '''
+packages:
+    description: One entry per requested package with the action taken and its version before and after.
+    returned: always
+    type: list
+    elements: dict
+    sample: [{"name": "ls", "state": "present", "action": "install", "before": null, "after": "0.2.1", "changed": true}]
+commands:
+    description: Commands that were (or in check mode would have been) run to converge the list.
+    returned: always
+    type: list
+    elements: list
+'''
+
+import abc
+import json
+import re
+
+from collections import OrderedDict
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.common.text.converters import to_native
+
+STATES = ('present', 'latest', 'absent')
+EXACT_VERSION = re.compile(r'^v?\d[0-9A-Za-z.+-]*$')
+
+
+class PackageBatchError(Exception):
+    pass
+
+
+class PackageManager(abc.ABC):
+    """Queries and changes the global packages of one manager executable."""
+
+    name = None
+    # Whether the install command also upgrades outdated packages, saving a second command
+    install_upgrades = False
+
+    def __init__(self, module, executable):
+        self.module = module
+        self.executable = executable
+
+    def run(self, args, check_rc=True):
+        cmd = [self.executable] + args
+        rc, out, err = self.module.run_command(cmd)
+        if check_rc and rc != 0:
+            raise PackageBatchError('%s failed (rc=%d): %s' % (' '.join(cmd), rc, to_native(err or out).strip()))
+        return rc, out, err
+
+    def key(self, name):
+        return name
+
+    @abc.abstractmethod
+    def installed(self):
+        """Map of normalized name -> list of installed versions"""
+
+    @abc.abstractmethod
+    def outdated(self):
+        """Set of normalized names with a newer version available, or None if the manager cannot tell"""
+
+    def spec(self, package):
+        return package['name'] if package['version'] is None else '%s@%s' % (package['name'], package['version'])
+
+    @abc.abstractmethod
+    def install_args(self, packages):
+        """Arguments installing packages"""
+
+    def upgrade_args(self, packages):
+        return self.install_args(packages)
+
+    @abc.abstractmethod
+    def remove_args(self, packages):
+        """Arguments removing packages"""
+
+    def commands(self, actions):
+        """Argument lists converging the planned actions, one per batch"""
+        commands = []
+        if actions['remove']:
+            commands.append(self.remove_args(actions['remove']))
+        if self.install_upgrades:
+            if actions['install'] or actions['upgrade']:
+                commands.append(self.install_args(actions['install'] + actions['upgrade']))
+            return commands
+        if actions['install']:
+            commands.append(self.install_args(actions['install']))
+        if actions['upgrade']:
+            commands.append(self.upgrade_args(actions['upgrade']))
+        return commands
+
+
+class Npm(PackageManager):
+    name = 'npm'
+    install_upgrades = True
+
+    def installed(self):
+        # npm ls exits non-zero on peer dependency problems but still prints the tree
+        rc, out, err = self.run(['ls', '--global', '--depth=0', '--json'], check_rc=False)
+        try:
+            data = json.loads(out or '{}')
+        except ValueError:
+            raise PackageBatchError('npm ls failed (rc=%d): %s' % (rc, to_native(err).strip()))
+        return dict((name, [info.get('version')]) for name, info in (data.get('dependencies') or {}).items())
+
+    def outdated(self):
+        # Exit status 1 just means something is outdated
+        rc, out, err = self.run(['outdated', '--global', '--json'], check_rc=False)
+        return set(json.loads(out or '{}'))
+
+    def spec(self, package):
+        if package.get('action') == 'upgrade':
+            return '%s@latest' % package['name']
+        return super(Npm, self).spec(package)
+
+    def install_args(self, packages):
+        return ['install', '--global'] + [self.spec(p) for p in packages]
+
+    def remove_args(self, packages):
+        return ['uninstall', '--global'] + [p['name'] for p in packages]
+
+
+class Pip(PackageManager):
+    name = 'pip'
+
+    def key(self, name):
+        return re.sub(r'[-_.]+', '-', name.split('[')[0]).lower()
+
+    def installed(self):
+        out = self.run(['list', '--format=json', '--disable-pip-version-check'])[1]
+        return dict((self.key(p['name']), [p['version']]) for p in json.loads(out or '[]'))
+
+    def outdated(self):
+        out = self.run(['list', '--outdated', '--format=json', '--disable-pip-version-check'])[1]
+        return set(self.key(p['name']) for p in json.loads(out or '[]'))
+
+    def spec(self, package):
+        version = package['version']
+        if version is None:
+            return package['name']
+        # Like the pip module: a bare version means ==, anything else is already a specifier
+        return package['name'] + (version if version[0] in '<>=!~' else '==' + version)
+
+    def install_args(self, packages):
+        return ['install', '--disable-pip-version-check'] + [self.spec(p) for p in packages]
+
+    def upgrade_args(self, packages):
+        return ['install', '--upgrade', '--disable-pip-version-check'] + [p['name'] for p in packages]
+
+    def remove_args(self, packages):
+        return ['uninstall', '--yes'] + [p['name'] for p in packages]
+
+
+class Gem(PackageManager):
+    name = 'gem'
+    # gem install without a version fetches the newest release
+    install_upgrades = True
+
+    def installed(self):
+        out = self.run(['list', '--local', '--no-details'])[1]
+        packages = {}
+        for line in out.splitlines():
+            match = re.match(r'^(\S+) \((.*)\)$', line.strip())
+            if match:
+                packages[match.group(1)] = [v.replace('default:', '').strip().split(' ')[0]
+                                            for v in match.group(2).split(',')]
+        return packages
+
+    def outdated(self):
+        out = self.run(['outdated'])[1]
+        return set(line.split(' ')[0] for line in out.splitlines() if line.strip())
+
+    def spec(self, package):
+        if package['version'] is None or package.get('action') == 'upgrade':
+            return package['name']
+        return '%s:%s' % (package['name'], package['version'])
+
+    def install_args(self, packages):
+        return ['install', '--no-document', '--no-user-install'] + [self.spec(p) for p in packages]
+
+    def remove_args(self, packages):
+        return ['uninstall', '--all', '--executables', '--no-user-install'] + [p['name'] for p in packages]
+
+
+class Composer(PackageManager):
+    name = 'composer'
+
+    def key(self, name):
+        return name.lower()
+
+    def installed(self):
+        out = self.run(['global', 'show', '--direct', '--format=json', '--no-interaction'])[1]
+        return dict((self.key(p['name']), [p['version'].lstrip('v')])
+                    for p in json.loads(out or '{}').get('installed', []))
+
+    def outdated(self):
+        out = self.run(['global', 'outdated', '--direct', '--format=json', '--no-interaction'])[1]
+        return set(self.key(p['name']) for p in json.loads(out or '{}').get('installed', []))
+
+    def spec(self, package):
+        return '%s:%s' % (package['name'], package['version'] or '@stable')
+
+    def install_args(self, packages):
+        return ['global', 'require', '--no-interaction'] + [self.spec(p) for p in packages]
+
+    def upgrade_args(self, packages):
+        return ['global', 'update', '--no-interaction'] + [p['name'] for p in packages]
+
+    def remove_args(self, packages):
+        return ['global', 'remove', '--no-interaction'] + [p['name'] for p in packages]
+
+
+class Uv(PackageManager):
+    name = 'uv'
+
+    def installed(self):
+        out = self.run(['tool', 'list'])[1]
+        packages = {}
+        for line in out.splitlines():
+            # "<name> v<version>", followed by "- <executable>" lines
+            parts = line.split()
+            if len(parts) >= 2 and not line.startswith(('-', ' ')):
+                packages[parts[0]] = [parts[1].lstrip('v')]
+        return packages
+
+    def outdated(self):
+        return None
+
+    def spec(self, package):
+        return package['name'] if package['version'] is None else '%s==%s' % (package['name'], package['version'])
+
+    def install_args(self, packages):
+        return ['tool', 'install'] + [self.spec(p) for p in packages]
+
+    def commands(self, actions):
+        # uv tool install takes a single package, the other commands take several
+        commands = [self.install_args([p]) for p in actions['install']]
+        actions = dict(actions, install=[])
+        return commands + super(Uv, self).commands(actions)
+
+    def upgrade_args(self, packages):
+        return ['tool', 'upgrade'] + [p['name'] for p in packages]
+
+    def remove_args(self, packages):
+        return ['tool', 'uninstall'] + [p['name'] for p in packages]
+
+
+MANAGERS = dict((cls.name, cls) for cls in (Composer, Npm, Pip, Gem, Uv))
+DEFAULT_EXECUTABLES = dict(composer='composer', npm='npm', pip='pip3', gem='gem', uv='uv')
+
+
+def normalize_packages(packages, default_executable):
+    """Turn the package list into dicts and group it by executable, keeping its order."""
+    groups = OrderedDict()
+    for package in packages:
+        if not isinstance(package, dict):
+            package = dict(name=package)
+        if not package.get('name'):
+            raise PackageBatchError('Package %r has no name' % (package,))
+        state = package.get('state') or 'present'
+        if state not in STATES:
+            raise PackageBatchError('Package %s has invalid state %r' % (package['name'], state))
+        version = package.get('version')
+        entry = dict(name=str(package['name']), state=state, version=None if version is None else str(version))
+        groups.setdefault(package.get('executable') or default_executable, []).append(entry)
+    return groups
+
+
+def version_satisfied(installed_versions, version):
+    if version is None:
+        return True
+    if EXACT_VERSION.match(version):
+        return version.lstrip('v') in [v.lstrip('v') for v in installed_versions if v]
+    return True
+
+
+def plan(manager, packages, installed):
+    """Split packages into install/upgrade/remove batches; the outdated query runs at most once."""
+    actions = OrderedDict((action, []) for action in ('install', 'upgrade', 'remove'))
+    latest = [p for p in packages if p['state'] == 'latest' and manager.key(p['name']) in installed]
+    outdated = manager.outdated() if latest else set()
+    for package in packages:
+        versions = installed.get(manager.key(package['name']))
+        if package['state'] == 'absent':
+            action = 'remove' if versions else None
+        elif not versions or not version_satisfied(versions, package['version']):
+            action = 'install'
+        elif package['state'] == 'latest' and (outdated is None or manager.key(package['name']) in outdated):
+            action = 'upgrade'
+        else:
+            action = None
+        package['action'] = action
+        if action:
+            actions[action].append(package)
+    return actions
+
+
+def converge(module, manager_name, packages, default_executable, check_mode=False):
+    results = []
+    commands = []
+    for executable, group in normalize_packages(packages, default_executable).items():
+        manager = MANAGERS[manager_name](module, module.get_bin_path(executable, required=True))
+        installed = manager.installed()
+        actions = plan(manager, group, installed)
+
+        batches = manager.commands(actions)
+        commands.extend([manager.executable] + args for args in batches)
+
+        if not check_mode:
+            for args in batches:
+                manager.run(args)
+        after = manager.installed() if batches and not check_mode else installed
+
+        for package in group:
+            key = manager.key(package['name'])
+            before_version = (installed.get(key) or [None])[0]
+            after_version = (after.get(key) or [None])[0]
+            if check_mode:
+                changed = package['action'] is not None
+            else:
+                changed = before_version != after_version
+            results.append(dict(name=package['name'], state=package['state'], action=package['action'],
+                                before=before_version, after=after_version, changed=changed))
+    return results, commands
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            manager=dict(type='str', required=True, choices=sorted(MANAGERS)),
+            packages=dict(type='list', elements='raw', required=True),
+            executable=dict(type='str'),
+        ),
+        supports_check_mode=True,
+    )
+
+    manager = module.params['manager']
+    executable = module.params['executable'] or DEFAULT_EXECUTABLES[manager]
+    try:
+        results, commands = converge(module, manager, module.params['packages'], executable, module.check_mode)
+    except (PackageBatchError, ValueError, KeyError) as e:
+        module.fail_json(msg=to_native(e))
+
+    module.exit_json(changed=any(r['changed'] for r in results), packages=results, commands=commands)
+
+
+if __name__ == '__main__':
+    main()
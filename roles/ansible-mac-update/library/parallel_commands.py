@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Concurrent shell commands for the parallel mode of the ansible-mac-update role
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    module: parallel_commands
+    author: mac-dev-playbook maintainers
+    short_description: Run shell commands concurrently, at most a given number at a time
+    description:
+        - Runs each of O(commands) with O(executable) C(-c) and returns their output once all have finished.
+        - At most O(limit) commands run at the same time; as soon as one finishes the next one starts, so a slow
+          command only holds its own slot.
+        - A command counts as changed when its output contains C(ANSIBLE_CHANGED).
+        - A command still running after O(timeout) seconds is killed with its process group and reported with
+          C(timed_out=true) and no C(rc).
+    options:
+      commands:
+        description: Commands to run, in the order their results are returned.
+        type: list
+        elements: dict
+        required: true
+        suboptions:
+          name:
+            description: Name of the command in the results.
+            type: str
+            required: true
+          cmd:
+            description: Shell script to run.
+            type: str
+            required: true
+          ignore_errors:
+            description: Leave the command out of RV(failed_commands) when it fails.
+            type: bool
+            default: false
+      limit:
+        description: Maximum number of commands running at the same time.
+        type: int
+        default: 4
+      timeout:
+        description: Seconds a command may run before it is killed.
+        type: int
+        default: 3600
+      executable:
+        description: Shell running the commands.
+        type: path
+        default: /bin/bash
+    notes:
+      - Does not support check mode; the commands are skipped.
+      - The module fails only on invalid arguments. Failed commands are listed in RV(failed_commands), so the
+        caller can report every result before failing.
+'''
+
+EXAMPLES = '''
+- name: Run updaters
+  parallel_commands:
+    commands:
+      - name: uv
+        cmd: uv tool upgrade --all
+      - name: krew
+        cmd: kubectl krew update && kubectl krew upgrade && echo ANSIBLE_CHANGED
+    limit: 2
+  register: updaters
+'''
+
+RETURN = '''
+results:
+    description: One entry per command, in the order of O(commands).
+    returned: always
+    type: list
+    elements: dict
+    sample: [{"name": "uv", "rc": 0, "stdout": "Nothing to upgrade", "stderr": "", "changed": false,
+              "timed_out": false, "ignore_errors": false, "delta": "0:00:01.204312"}]
+failed_commands:
+    description: Names of the commands that failed or timed out, without those with C(ignore_errors).
+    returned: always
+    type: list
+    elements: str
+'''
+
+import datetime
+import os
+import signal
+import subprocess
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.common.text.converters import to_text
+
+CHANGED_MARKER = 'ANSIBLE_CHANGED'
+
+
+def run_command(command, executable, timeout):
+    """Result of one command; its process group is killed after timeout seconds"""
+    started = time.time()
+    process = subprocess.Popen([executable, '-c', command['cmd']], stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+    try:
+        out, err = process.communicate(timeout=timeout)
+        timed_out = False
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        out, err = process.communicate()
+        timed_out = True
+    stdout = to_text(out, errors='surrogate_or_replace')
+    return dict(
+        name=command['name'],
+        rc=None if timed_out else process.returncode,
+        stdout=stdout,
+        stderr=to_text(err, errors='surrogate_or_replace'),
+        changed=CHANGED_MARKER in stdout,
+        timed_out=timed_out,
+        ignore_errors=command['ignore_errors'],
+        delta=str(datetime.timedelta(seconds=time.time() - started)),
+    )
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            commands=dict(type='list', elements='dict', required=True, options=dict(
+                name=dict(type='str', required=True),
+                cmd=dict(type='str', required=True),
+                ignore_errors=dict(type='bool', default=False),
+            )),
+            limit=dict(type='int', default=4),
+            timeout=dict(type='int', default=3600),
+            executable=dict(type='path', default='/bin/bash'),
+        ),
+    )
+
+    params = module.params
+    if params['limit'] < 1:
+        module.fail_json(msg='limit must be at least 1, got %d' % params['limit'])
+
+    results = []
+    if params['commands']:
+        with ThreadPoolExecutor(max_workers=params['limit']) as executor:
+            results = list(executor.map(lambda command: run_command(command, params['executable'], params['timeout']),
+                                        params['commands']))
+
+    failed = [r['name'] for r in results if r['rc'] != 0 and not r['ignore_errors']]
+    module.exit_json(changed=any(r['changed'] for r in results), results=results, failed_commands=failed)
+
+
+if __name__ == '__main__':
+    main()
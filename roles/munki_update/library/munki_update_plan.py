@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Structured, cached result of managedsoftwareupdate --checkonly for the munki_update role
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    module: munki_update_plan
+    author: mac-dev-playbook maintainers
+    short_description: Run managedsoftwareupdate --checkonly and return the pending updates as a plan
+    description:
+        - Runs C(managedsoftwareupdate --checkonly) and parses its output into a list of items, each with the
+          package name, version, action (C(install) or C(remove)) and whether a restart or logout is required.
+        - The plan is cached in O(cache_file); while it is younger than O(ttl) seconds and was made with the same
+          options, it is returned without running the check again.
+        - An entry of O(skip_if_present) matches when it appears anywhere in the C(--checkonly) output, as a
+          case-sensitive substring, like the C(search) test the role used before this module.
+    options:
+      applesuspkgsonly:
+        description: Pass C(--applesuspkgsonly).
+        type: bool
+        default: false
+      munkipkgsonly:
+        description: Pass C(--munkipkgsonly).
+        type: bool
+        default: false
+      skip_if_present:
+        description: Strings whose presence in the C(--checkonly) output should prevent the installation.
+        type: list
+        elements: str
+        default: []
+      cache_file:
+        description: JSON file holding the last plan.
+        type: path
+        default: /var/tmp/ansible-munki-update-plan.json
+      ttl:
+        description: Seconds a cached plan stays valid; C(0) always runs the check.
+        type: int
+        default: 0
+      executable:
+        description: Path of managedsoftwareupdate.
+        type: path
+        default: /usr/local/munki/managedsoftwareupdate
+    notes:
+      - Supports check mode; the check only reads state, so it also runs in check mode.
+      - Remove O(cache_file) after installing updates so the next run checks again.
+'''
+
+EXAMPLES = '''
+- name: Get the Munki update plan
+  munki_update_plan:
+    skip_if_present: "{{ munki_skip_if_present }}"
+    ttl: 3600
+  register: munki_plan
+'''
+
+RETURN = '''
+updates:
+    description: Pending items in the order managedsoftwareupdate lists them.
+    returned: always
+    type: list
+    elements: dict
+    sample: [{"name": "Firefox", "version": "121.0", "action": "install", "restart": false, "logout": false}]
+pending:
+    description: Whether anything is to be installed or removed.
+    returned: always
+    type: bool
+restart_required:
+    description: Whether any pending item requires or recommends a restart.
+    returned: always
+    type: bool
+skipped_by:
+    description: Entries of O(skip_if_present) found in the C(--checkonly) output.
+    returned: always
+    type: list
+    elements: str
+cached:
+    description: Whether the plan came from O(cache_file).
+    returned: always
+    type: bool
+checked_at:
+    description: Unix time of the check the plan is based on.
+    returned: always
+    type: float
+'''
+
+import json
+import os
+import re
+import tempfile
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.common.text.converters import to_native
+
+ITEM_RE = re.compile(r'^\s*([+-])\s+(\S.*?)\s*$')
+NAME_VERSION_RE = re.compile(r'^(.+)-(\d[^\s-]*)$')
+
+
+def parse_checkonly(output):
+    """Turn managedsoftwareupdate --checkonly output into a list of plan items"""
+    items = []
+    for line in output.splitlines():
+        match = ITEM_RE.match(line)
+        if match:
+            sign, entry = match.groups()
+            name, version = entry, None
+            if sign == '+':
+                name_version = NAME_VERSION_RE.match(entry)
+                if name_version:
+                    name, version = name_version.groups()
+            items.append(dict(name=name, version=version, action='install' if sign == '+' else 'remove',
+                              restart=False, logout=False))
+        elif items and line.strip().startswith('*'):
+            # Detail lines belong to the item above them
+            note = line.strip().lower()
+            if 'restart' in note:
+                items[-1]['restart'] = True
+            elif 'logout' in note:
+                items[-1]['logout'] = True
+    return items
+
+
+def load_cache(path, options, ttl):
+    if not ttl or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    # Plans cached before the output was kept cannot answer skip_if_present
+    if cache.get('options') != options or 'output' not in cache or time.time() - cache.get('checked_at', 0) > ttl:
+        return None
+    return cache
+
+
+def save_cache(path, cache):
+    directory = os.path.dirname(path) or '.'
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.munki_update_plan')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp, path)
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            applesuspkgsonly=dict(type='bool', default=False),
+            munkipkgsonly=dict(type='bool', default=False),
+            skip_if_present=dict(type='list', elements='str', default=[]),
+            cache_file=dict(type='path', default='/var/tmp/ansible-munki-update-plan.json'),
+            ttl=dict(type='int', default=0),
+            executable=dict(type='path', default='/usr/local/munki/managedsoftwareupdate'),
+        ),
+        supports_check_mode=True,
+    )
+
+    params = module.params
+    cmd = [params['executable'], '--checkonly']
+    if params['applesuspkgsonly']:
+        cmd.append('--applesuspkgsonly')
+    if params['munkipkgsonly']:
+        cmd.append('--munkipkgsonly')
+
+    cache = load_cache(params['cache_file'], cmd, params['ttl'])
+    cached = cache is not None
+    if not cached:
+        rc, out, err = module.run_command(cmd)
+        if rc != 0:
+            module.fail_json(msg='%s failed: %s' % (' '.join(cmd), to_native(err or out).strip()), rc=rc,
+                             stdout=out, stderr=err)
+        cache = dict(options=cmd, checked_at=time.time(), items=parse_checkonly(out), output=out)
+        if params['ttl'] and not module.check_mode:
+            try:
+                save_cache(params['cache_file'], cache)
+            except (IOError, OSError) as e:
+                module.warn('Could not write %s: %s' % (params['cache_file'], to_native(e)))
+
+    items = cache['items']
+    skipped_by = [name for name in params['skip_if_present'] if name in cache['output']]
+
+    module.exit_json(changed=False, updates=items, pending=bool(items),
+                     restart_required=any(item['restart'] for item in items), skipped_by=skipped_by,
+                     cached=cached, checked_at=cache['checked_at'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Track which macapply sections changed since their last successful run
+
+Every tag of plays/full.yml gets a hash over its inputs: the task files, the
+group_vars/host_vars files it reads, the files it deploys and the versions
+of the roles/collections it uses from requirements.yml. Inputs of the
+untagged parts (pre_tasks, plays/full.yml itself, ...) count for every tag.
+
+  apply-state.py unchanged --host HOST
+      print the tags whose inputs match the last successful run (comma separated);
+      exit status 3 if that is every tag
+  apply-state.py record --host HOST [--tags T] [--skip-tags T] [--summary summary.json]
+      store the current hashes of the tags that just ran; refused if the
+      readable_yaml summary shows failed, rescued or unreachable tasks
+
+File hashes are cached by size and mtime, so an unchanged tree is not re-read.
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'lib'))
+from defaults_yaml import REPO_DIR, load_yaml  # noqa: E402
+
+STATE_DIR = Path.home() / '.ansible/macapply-state'
+
+# Inputs of everything that runs regardless of tags
+COMMON_INPUTS = (
+    'ansible.cfg',
+    'plays/full.yml',
+    'requirements.txt',
+    'inventories/macs.list',
+    'inventories/group_vars/*/general.yml',
+    'inventories/group_vars/*/onepassword.yml',
+    'inventories/group_vars/*/secrets.yml',
+    'inventories/host_vars/{host}.yml',
+    'tasks/pre/**/*',
+    'files/scripts/**/*',
+    # Modules of the local roles; not used by a tag of plays/full.yml today,
+    # so a change re-runs every tag rather than going unnoticed
+    'roles/*/library/**/*',
+)
+COMMON_REQUIREMENTS = ('elliotweiser.osx-command-line-tools',)
+
+TAG_INPUTS = {
+    'homebrew': ('inventories/group_vars/*/brew.yml', 'files/brewfile/**/*'),
+    'dotfiles': ('tasks/dotfiles.yml', 'inventories/group_vars/*/dotfiles.yml'),
+    'osx': ('tasks/osx.yml', 'tasks/finder.yml', 'tasks/system.yml', 'files/system/**/*'),
+    'fonts': ('tasks/fonts.yml', 'library/font_install.py', 'inventories/group_vars/*/fonts.yml',
+              'files/fonts/**/*'),
+    'extra-packages': ('tasks/extra-packages.yml', 'library/package_batch.py',
+                       'inventories/group_vars/*/additional-packages.yml',
+                       'inventories/group_vars/*/nodejs.yml', 'inventories/group_vars/*/krew.yml'),
+    'post': ('tasks/post/**/*', 'library/osx_defaults_batch.py', 'library/launchagents_batch.py',
+             'library/hazel_state.py', 'files/Hazel/**/*', 'files/iterm/**/*',
+             'inventories/group_vars/*/defaults.yml', 'inventories/group_vars/*/post.yml',
+             'inventories/group_vars/*/LaunchAgents.yml', 'inventories/group_vars/*/login_items.yml',
+             'inventories/group_vars/*/hazel.yml', 'inventories/group_vars/*/munki.yml',
+             'inventories/group_vars/*/printers.yml'),
+    'dock': ('tasks/dock.yml', 'library/dock_layout.py', 'inventories/group_vars/*/dock.yml'),
+}
+TAG_REQUIREMENTS = {
+    'homebrew': ('geerlingguy.mac',),
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', choices=('unchanged', 'record'))
+    parser.add_argument('--host', required=True, help='inventory hostname')
+    parser.add_argument('--tags', default='', help='--tags of the run (default: all tags)')
+    parser.add_argument('--skip-tags', default='', help='--skip-tags of the run')
+    parser.add_argument('--summary', type=Path, help='stats written by the readable_yaml callback (summary_file)')
+    parser.add_argument('--state-dir', type=Path, default=STATE_DIR, help='state directory (default: %(default)s)')
+    return parser.parse_args()
+
+def split_tags(value):
+    return {tag.strip() for tag in value.split(',') if tag.strip()}
+
+class FileHasher(object):
+    """SHA-256 of files, cached by (size, mtime) across runs"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def __call__(self, path):
+        st = path.stat()
+        key = str(path.relative_to(REPO_DIR))
+        entry = self.cache.get(key)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        self.cache[key] = [st.st_size, st.st_mtime_ns, digest.hexdigest()]
+        return self.cache[key][2]
+
+def requirement_versions():
+    """name -> version of every role/collection in requirements.yml"""
+    data = load_yaml(REPO_DIR / 'requirements.yml') or {}
+    versions = {}
+    for section in ('roles', 'collections'):
+        for entry in data.get(section) or []:
+            versions[entry['name']] = str(entry.get('version', ''))
+    return versions
+
+def inputs_hash(patterns, requirements, host, hasher, versions):
+    """One hash over the matching files (path + content) and the pinned requirement versions"""
+    files = set()
+    for pattern in patterns:
+        files.update(path for path in REPO_DIR.glob(pattern.format(host=host)) if path.is_file())
+    digest = hashlib.sha256()
+    for path in sorted(files):
+        digest.update(f"{path.relative_to(REPO_DIR)}\0{hasher(path)}\n".encode('utf-8'))
+    for name in requirements:
+        digest.update(f"{name}@{versions.get(name, '')}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def unclaimed_modules():
+    """Modules in library/ that no tag lists; they count for every tag"""
+    claimed = {path for patterns in TAG_INPUTS.values() for pattern in patterns for path in REPO_DIR.glob(pattern)}
+    return tuple(str(path.relative_to(REPO_DIR)) for path in sorted(REPO_DIR.glob('library/*.py'))
+                 if path not in claimed)
+
+def tag_hashes(host, hasher):
+    versions = requirement_versions()
+    common = inputs_hash(COMMON_INPUTS + unclaimed_modules(), COMMON_REQUIREMENTS, host, hasher, versions)
+    return {
+        tag: hashlib.sha256((common + inputs_hash(patterns, TAG_REQUIREMENTS.get(tag, ()), host, hasher,
+                                                  versions)).encode('ascii')).hexdigest()
+        for tag, patterns in TAG_INPUTS.items()
+    }
+
+def load_state(path):
+    if not path.exists():
+        return {'tags': {}, 'files': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_state(state, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    tmp.replace(path)
+
+def run_succeeded(summary_path, host):
+    """True if the readable_yaml summary shows no failed, rescued or unreachable tasks for host"""
+    with open(summary_path, 'r') as f:
+        stats = json.load(f).get(host)
+    return bool(stats) and not (stats.get('failures') or stats.get('rescued') or stats.get('unreachable'))
+
+def main():
+    args = parse_args()
+    state_file = args.state_dir / f"{args.host}.json"
+    state = load_state(state_file)
+    hasher = FileHasher(state.setdefault('files', {}))
+    current = tag_hashes(args.host, hasher)
+
+    if args.command == 'unchanged':
+        unchanged = [tag for tag, digest in current.items() if state['tags'].get(tag) == digest]
+        print(','.join(unchanged))
+        # Keep the refreshed file hash cache
+        save_state(state, state_file)
+        sys.exit(3 if len(unchanged) == len(current) else 0)
+
+    if args.summary is not None and not (args.summary.exists() and run_succeeded(args.summary, args.host)):
+        print(f"Not recording: {args.summary} shows failed or rescued tasks for {args.host}", file=sys.stderr)
+        sys.exit(1)
+
+    ran = split_tags(args.tags) - {'all'} or set(TAG_INPUTS)
+    ran -= split_tags(args.skip_tags)
+    for tag in ran & set(TAG_INPUTS):
+        state['tags'][tag] = current[tag]
+    save_state(state, state_file)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark the sqlite_facts cache plugin against jsonfile
+
+Stores the facts of 60 hosts (macOS setup facts of about 40 KB each, generated)
+with ansible's jsonfile cache plugin and with cache_plugins/sqlite_facts.py,
+through the same cache plugin API ansible uses, and times:
+
+  first run    set() for every host into an empty cache
+  rerun        set() with the volatile facts changed (date_time, uptime, memory),
+               as after every gather_facts
+  read         get() for every host from a new plugin instance, as the next
+               ansible-playbook run (or a play using cached facts) does
+
+Each scenario gets a fresh directory below --dir (a temporary one by default);
+point --dir at a synced folder such as iCloud Drive to see what the jsonfile
+cache costs there. --export-dir additionally lets sqlite_facts mirror the cache
+in jsonfile layout, as ansible.cfg configures it, waiting for the background
+export to finish.
+
+Needs ansible-core importable.
+"""
+
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PLUGINS = Path(__file__).resolve().parent.parent / 'cache_plugins'
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--hosts', type=int, default=60, help='number of hosts (default: %(default)s)')
+    parser.add_argument('--dir', type=Path, help='directory for the caches (default: a temporary directory)')
+    parser.add_argument('--export-dir', type=Path, help='let sqlite_facts also export to this directory')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated facts (default: %(default)s)')
+    return parser.parse_args()
+
+def host_facts(rng, index):
+    """Facts shaped like those of setup on a Mac"""
+    interfaces = [f"en{i}" for i in range(8)] + ['lo0', 'bridge0', 'utun0', 'utun1', 'awdl0', 'llw0']
+    facts = {
+        'ansible_hostname': f"mac{index:03d}", 'ansible_fqdn': f"mac{index:03d}.example.com",
+        'ansible_distribution': 'MacOSX', 'ansible_distribution_version': '14.5',
+        'ansible_architecture': 'arm64', 'ansible_processor_cores': 10, 'ansible_memtotal_mb': 32768,
+        'ansible_interfaces': interfaces,
+        'ansible_env': {f"VAR_{i}": f"/Users/me/{'x' * rng.randint(5, 60)}" for i in range(45)},
+        'ansible_mounts': [{'mount': f"/System/Volumes/{name}", 'device': f"/dev/disk3s{i}", 'fstype': 'apfs',
+                            'size_total': 994662584320, 'size_available': rng.randint(10 ** 9, 10 ** 11),
+                            'options': 'rw,nobrowse,journaled'} for i, name in enumerate(
+                                ('Data', 'VM', 'Preboot', 'Update', 'xarts', 'iSCPreboot', 'Hardware'))],
+        'ansible_local': {'macupdate': {'last_run': '2024-05-02', 'pending': []}},
+    }
+    for name in interfaces:
+        facts[f"ansible_{name}"] = {
+            'device': name, 'flags': ['UP', 'BROADCAST', 'SMART', 'RUNNING', 'SIMPLEX', 'MULTICAST'],
+            'macaddress': ':'.join(f"{rng.randrange(256):02x}" for _ in range(6)), 'mtu': 1500,
+            'ipv4': [{'address': f"10.{index}.{rng.randrange(256)}.{rng.randrange(256)}", 'netmask': '255.255.255.0'}],
+            'ipv6': [{'address': f"fe80::{rng.randrange(65536):x}:{rng.randrange(65536):x}", 'prefix': '64',
+                      'scope': '0x4'} for _ in range(3)],
+            'media': 'Unknown', 'status': 'active', 'type': 'ether',
+        }
+    facts.update({f"ansible_fact_{i}": 'v' * rng.randint(10, 200) for i in range(60)})
+    facts.update(volatile_facts(rng))
+    return facts
+
+def volatile_facts(rng):
+    """The facts that change between two runs on the same host"""
+    now = time.time() + rng.random() * 3600
+    return {
+        'ansible_date_time': {'epoch': str(int(now)), 'iso8601': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(now)),
+                              'time': time.strftime('%H:%M:%S', time.gmtime(now))},
+        'ansible_uptime_seconds': rng.randint(1000, 10 ** 7),
+        'ansible_memfree_mb': rng.randint(100, 30000),
+    }
+
+def load_plugin(name, directory, **options):
+    from ansible.plugins.loader import cache_loader
+
+    cache_loader.add_directory(str(PLUGINS))
+    return cache_loader.get(name, _uri=str(directory), _timeout=86400, **options)
+
+def wait_for_exports():
+    for thread in threading.enumerate():
+        if thread.name == 'sqlite_facts-export':
+            thread.join()
+
+def disk_usage(directory):
+    return sum(path.stat().st_size for path in Path(directory).rglob('*') if path.is_file())
+
+def run(name, directory, hosts, rng, options):
+    """Timings of the three scenarios for one plugin"""
+    timings = {}
+    cache = load_plugin(name, directory, **options)
+    started = time.perf_counter()
+    for host, facts in hosts.items():
+        cache.set(host, facts)
+    wait_for_exports()
+    timings['first run'] = time.perf_counter() - started
+
+    rerun = {host: dict(facts, **volatile_facts(rng)) for host, facts in hosts.items()}
+    cache = load_plugin(name, directory, **options)
+    started = time.perf_counter()
+    for host, facts in rerun.items():
+        cache.set(host, facts)
+    wait_for_exports()
+    timings['rerun'] = time.perf_counter() - started
+
+    cache = load_plugin(name, directory, **options)
+    started = time.perf_counter()
+    for host, facts in rerun.items():
+        if cache.get(host) != facts:
+            sys.exit(f"FAIL: {name} returned other facts for {host}")
+    timings['read'] = time.perf_counter() - started
+    timings['size'] = disk_usage(directory)
+    return timings
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    hosts = {f"mac{index:03d}": host_facts(rng, index) for index in range(args.hosts)}
+
+    base = Path(tempfile.mkdtemp(prefix='bench-fact-cache.', dir=args.dir))
+    try:
+        sqlite_options = {'export_dir': str(args.export_dir)} if args.export_dir else {}
+        results = {
+            'jsonfile': run('jsonfile', base / 'jsonfile', hosts, random.Random(args.seed), {}),
+            'sqlite_facts': run('sqlite_facts', base / 'sqlite_facts', hosts, random.Random(args.seed), sqlite_options),
+        }
+    finally:
+        shutil.rmtree(base)
+
+    export = f", exporting to {args.export_dir}" if args.export_dir else ''
+    print(f"{args.hosts} hosts in {args.dir or tempfile.gettempdir()}{export}")
+    print(f"{'':12}{'jsonfile':>12}{'sqlite_facts':>14}")
+    for scenario in ('first run', 'rerun', 'read'):
+        json_time, sqlite_time = (results[name][scenario] for name in ('jsonfile', 'sqlite_facts'))
+        print(f"{scenario:12}{json_time * 1000:10.1f}ms{sqlite_time * 1000:12.1f}ms  {json_time / sqlite_time:5.1f}x")
+    print(f"{'on disk':12}{results['jsonfile']['size'] / 1024:10.0f}KB"
+          f"{results['sqlite_facts']['size'] / 1024:12.0f}KB")
+
+if __name__ == '__main__':
+    main()
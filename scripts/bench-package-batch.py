@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark the package_batch module against one module run per package
+
+tasks/extra-packages.yml used to run one npm/pip/gem/composer module per
+package, each doing its own query and install. This runs library/package_batch.py
+the same way against a fake global npm with a fixed cost per invocation: once
+per package (the old loop) and once for the whole list, for a fresh install
+and for a converged list.
+
+Needs ansible-core importable (the module is run directly); no real npm is
+touched, the fake keeps its state in a temporary directory.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+MODULE = Path(__file__).resolve().parent.parent / 'library/package_batch.py'
+
+FAKE_NPM = '''#!{python}
+import json, os, sys, time
+time.sleep(float(os.environ['FAKE_NPM_DELAY']))
+path = os.environ['FAKE_NPM_STATE']
+state = json.load(open(path)) if os.path.exists(path) else {{}}
+args = [a for a in sys.argv[1:] if not a.startswith('--')]
+if args[0] == 'ls':
+    print(json.dumps({{'dependencies': {{n: {{'version': v}} for n, v in state.items()}}}}))
+elif args[0] == 'install':
+    for spec in args[1:]:
+        name, _, version = spec[1:].partition('@')
+        state[spec[0] + name] = version if version not in ('', 'latest') else '1.0.0'
+elif args[0] == 'uninstall':
+    for name in args[1:]:
+        state.pop(name, None)
+json.dump(state, open(path, 'w'))
+'''
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--packages', type=int, default=40, help='packages in the list (default: %(default)s)')
+    parser.add_argument('--delay', type=float, default=0.1,
+                        help='seconds each npm invocation costs (default: %(default)s)')
+    return parser.parse_args()
+
+def run_module(workdir, env, packages):
+    """One module run, as ansible would start it; returns the result"""
+    args = workdir / 'args.json'
+    args.write_text(json.dumps({'ANSIBLE_MODULE_ARGS': {'manager': 'npm', 'packages': packages}}))
+    proc = subprocess.run([sys.executable, str(MODULE), str(args)], capture_output=True, text=True, env=env)
+    result = json.loads(proc.stdout)
+    if result.get('failed'):
+        sys.exit(f"package_batch failed: {result.get('msg')}")
+    return result
+
+def timed(workdir, env, runs):
+    started = time.perf_counter()
+    for packages in runs:
+        run_module(workdir, env, packages)
+    return time.perf_counter() - started
+
+def main():
+    args = parse_args()
+    packages = [f"bench-package-{i}" for i in range(args.packages)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        npm = workdir / 'bin/npm'
+        npm.parent.mkdir()
+        npm.write_text(FAKE_NPM.format(python=sys.executable))
+        npm.chmod(0o755)
+        state = workdir / 'state.json'
+        env = dict(os.environ, PATH=f"{npm.parent}{os.pathsep}{os.environ.get('PATH', '')}",
+                   FAKE_NPM_STATE=str(state), FAKE_NPM_DELAY=str(args.delay))
+
+        print(f"{args.packages} npm packages, {args.delay}s per npm invocation")
+        for mode, runs in (('loop', [[package] for package in packages]), ('batch', [packages])):
+            if state.exists():
+                state.unlink()
+            fresh = timed(workdir, env, runs)
+            converged = timed(workdir, env, runs)
+            print(f"  {mode:5}  fresh install: {fresh:6.2f}s   converged: {converged:6.2f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark the readable_yaml block scalar sanitizer
+
+Times the original per-character sanitizer of ReadableDumper.represent_scalar
+against the precompiled one in callback_plugins/readable_yaml.py on command
+output of 1 KB, 1 MB and 50 MB (brew-like lines with tabs, CRs, ANSI escapes
+and trailing spaces), and checks both return the same text.
+
+The second table re-checks SANITIZE_CACHE_MAX_LENGTH: per size, the cost of
+sanitizing a string against the cost of a memo hit for an equal string from
+another host (a new object, so hashing and comparing it is not free), and the
+memory the memo may hold if every entry has that size.
+"""
+
+import argparse
+import importlib.util
+import re
+import string
+import sys
+import time
+from pathlib import Path
+
+PLUGIN = Path(__file__).resolve().parent.parent / 'callback_plugins/readable_yaml.py'
+
+LINE = '==> Upgrading {i}\t\t1.{i}.0 -> 1.{i}.1\r\n\x1b[32m✓\x1b[0m Pouring formula-{i}--1.{i}.1.bottle.tar.gz   \n'
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1K,1M,50M', help='string sizes to time (default: %(default)s)')
+    parser.add_argument('--cache-sizes', default='1K,4K,16K,64K,256K,1M',
+                        help='string sizes for the memo table (default: %(default)s)')
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help='repeat each measurement for at least this many seconds (default: %(default)s)')
+    return parser.parse_args()
+
+def parse_size(text):
+    units = {'K': 1024, 'M': 1024 ** 2}
+    return int(text[:-1]) * units[text[-1].upper()] if text[-1].upper() in units else int(text)
+
+def load_plugin():
+    spec = importlib.util.spec_from_file_location('readable_yaml', PLUGIN)
+    plugin = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(plugin)
+    return plugin
+
+def original_sanitize(value):
+    """should_use_block and the block branch of represent_scalar before the sanitizer was compiled"""
+    for c in u"\u000a\u000d\u001c\u001d\u001e\u0085\u2028\u2029":
+        if c in value:
+            break
+    else:
+        return value
+    value = value.rstrip()
+    value = ''.join(x for x in value if x in string.printable or ord(x) >= 0xA0)
+    value = value.expandtabs()
+    value = re.sub(r'[\x0b\x0c\r]', '', value)
+    return re.sub(r' +\n', '\n', value)
+
+def command_output(size):
+    lines = []
+    length = i = 0
+    while length < size:
+        lines.append(LINE.format(i=i))
+        length += len(lines[-1])
+        i += 1
+    return ''.join(lines)[:size]
+
+def timed(function, *args, min_time):
+    """Best time of one call, repeated for at least min_time seconds"""
+    best = None
+    deadline = time.perf_counter() + min_time
+    while True:
+        started = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        if time.perf_counter() >= deadline:
+            return best
+
+def current_sanitize(plugin, value):
+    return plugin.sanitize_block(value) if plugin.should_use_block(value) else value
+
+def format_time(seconds):
+    return f"{seconds * 1000:10.3f} ms" if seconds >= 0.001 else f"{seconds * 1e6:10.1f} µs"
+
+def main():
+    args = parse_args()
+    plugin = load_plugin()
+
+    print('Sanitizer                        original        current   speedup')
+    for label in args.sizes.split(','):
+        value = command_output(parse_size(label))
+        if original_sanitize(value) != current_sanitize(plugin, value):
+            sys.exit(f"FAIL: the sanitizers disagree on the {label} string")
+        original = timed(original_sanitize, value, min_time=args.min_time)
+        current = timed(current_sanitize, plugin, value, min_time=args.min_time)
+        print(f"  {label:>5} {format_time(original)}  {format_time(current)}  {original / current:7.1f}x")
+
+    cache = plugin._sanitize_block_cached
+    entries = cache.cache_info().maxsize
+    print(f"\nMemo (cutoff {plugin.SANITIZE_CACHE_MAX_LENGTH // 1024} KiB, {entries} entries)"
+          '      miss            hit   hit/miss   memo bound')
+    for label in args.cache_sizes.split(','):
+        size = parse_size(label)
+        value = command_output(size)
+        cache.cache_clear()
+        miss = timed(plugin.sanitize_block, value, min_time=args.min_time)
+        cache(value)
+        # Equal strings from other hosts' results: new objects whose hash is not computed yet
+        copies = [''.join([value[:1], value[1:]]) for _ in range(max(4, min(100, 2 ** 26 // size)))]
+        started = time.perf_counter()
+        for copy in copies:
+            cache(copy)
+        hit = (time.perf_counter() - started) / len(copies)
+        marker = '  <- cutoff' if size == plugin.SANITIZE_CACHE_MAX_LENGTH else ''
+        print(f"  {label:>5}                      {format_time(miss)}  {format_time(hit)}  {hit / miss:8.2f}"
+              f"  {entries * size * 2 / 1024 ** 2:8.0f} MiB{marker}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Benchmark remove-orphaned-comments.py on synthetic .macos files
+
+Generates .macos files of the given sizes (200k lines by default, plus smaller
+ones to show the scaling) from the constructs a real one uses: section
+borders and titles, commented defaults writes, orphaned comments, commented-out
+commands, sudo/killall/PlistBuddy commands and if/for blocks. It then times:
+
+  tokenize   the shared classification pass (read_records, LiteralMatcher)
+  clean      clean_macos_file as shipped
+  original   clean_macos_file as it was before the shared tokenizer
+
+and checks that clean and original write the same file and remove the same
+lines. Time per line that stays flat across the sizes means the pass is linear.
+"""
+
+import argparse
+import importlib.util
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPTS = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPTS / 'lib'))
+from macos_script import read_records  # noqa: E402
+
+BORDER = '#' * 79 + '\n'
+DOMAINS = ('NSGlobalDomain', 'com.apple.dock', 'com.apple.finder', 'com.apple.Safari', 'com.apple.screencapture',
+           'com.apple.TextEdit', 'com.apple.ActivityMonitor', 'com.googlecode.iterm2', 'org.m0k.transmission')
+TYPES = (('-bool', 'true'), ('-bool', 'false'), ('-int', '2'), ('-float', '0.5'), ('-string', '"Always"'))
+OTHER_COMMANDS = ('sudo pmset -a hibernatemode 0', 'killall Dock', 'chflags nohidden ~/Library',
+                  '/usr/libexec/PlistBuddy -c "Set :DesktopViewSettings:IconViewSettings:gridSpacing 100" '
+                  '~/Library/Preferences/com.apple.finder.plist', 'sudo launchctl load -w /System/x.plist',
+                  'printf "%s\\n" done', 'xattr -d com.apple.quarantine file')
+COMMENTED_COMMANDS = ('#sudo nvram boot-args="-v"', '#defaults write com.apple.dock autohide -bool true',
+                      '#killall Finder', '#echo "skip"', '#')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='25000,50000,100000,200000',
+                        help='comma-separated line counts of the generated files (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated files (default: %(default)s)')
+    parser.add_argument('--skip-original', action='store_true', help='do not time the original implementation')
+    return parser.parse_args()
+
+def load_script(name):
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), SCRIPTS / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def synthetic_macos(count, rng):
+    """count lines of a plausible .macos: one section title every ~200 lines, settings with and without comments"""
+    lines = ['#!/usr/bin/env bash\n', '\n']
+    while len(lines) < count:
+        if rng.random() < 0.005 or len(lines) == 2:
+            lines += ['\n', BORDER, f"# Section {len(lines)}{' ' * 60}#\n", BORDER, '\n']
+            continue
+        choice = rng.random()
+        if choice < 0.5:
+            # A documented setting, sometimes with a blank line between comment and command
+            lines += [f"# {rng.choice(('Enable', 'Disable', 'Show', 'Hide'))} setting {len(lines)}\n"] * \
+                rng.choice((1, 1, 2))
+            if rng.random() < 0.2:
+                lines.append('\n')
+            flag, value = rng.choice(TYPES)
+            lines.append(f"defaults write {rng.choice(DOMAINS)} Key{len(lines)} {flag} {value}\n")
+        elif choice < 0.65:
+            # Orphaned: the setting below was migrated away
+            lines.append(f"# Migrated setting {len(lines)}\n")
+            lines += ['\n'] * rng.choice((0, 2, 3))
+        elif choice < 0.75:
+            lines.append(f"{rng.choice(COMMENTED_COMMANDS)}\n")
+        elif choice < 0.85:
+            lines.append(f"# Run {len(lines)}\n{rng.choice(OTHER_COMMANDS)}\n")
+        elif choice < 0.9:
+            lines += ['for app in "Dock" "Finder"; do\n', '\tkillall "${app}" &> /dev/null\n', 'done\n']
+        else:
+            lines.append('\n')
+    return ''.join(lines[:count])
+
+# clean_macos_file before the shared tokenizer, kept as the reference
+
+def original_is_section_border(line):
+    stripped = line.strip()
+    return stripped.startswith('###') and stripped.endswith('#')
+
+def original_is_section_title(lines, idx):
+    if idx < 1 or idx >= len(lines) - 1:
+        return False
+    current = lines[idx].strip()
+    return (current.startswith('#') and current.endswith('#') and
+            original_is_section_border(lines[idx - 1]) and original_is_section_border(lines[idx + 1]))
+
+def original_is_comment(line):
+    stripped = line.strip()
+    if not stripped.startswith('#') or original_is_section_border(line) or stripped == '#':
+        return False
+    if stripped.startswith('#!'):
+        return False
+    patterns = ['#sudo', '#defaults', '#launchctl', '#killall', '#osascript', '#rm ', '#mv ', '#cp ', '#ln ',
+                '#chmod', '#chflags', '#xattr', '#echo']
+    return not any(stripped.startswith(pattern) for pattern in patterns)
+
+def original_is_command(line):
+    stripped = line.strip()
+    if 'defaults write' in line and not stripped.startswith('#'):
+        return True
+    if not stripped or stripped.startswith('#'):
+        return False
+    patterns = ['sudo', 'osascript', 'killall', 'launchctl', '/usr/libexec/PlistBuddy', 'chflags', 'xattr', 'find',
+                'for app in', 'if [', 'fi', 'done', 'printf', 'defaults -currentHost']
+    return any(pattern in line for pattern in patterns)
+
+def original_should_keep_comment_block(lines, start_idx):
+    empty_lines_count = 0
+    for i in range(start_idx + 1, len(lines)):
+        line = lines[i]
+        if not line.strip():
+            empty_lines_count += 1
+            if empty_lines_count > 1:
+                return False
+            continue
+        if original_is_section_border(line) or original_is_comment(line):
+            return False
+        return original_is_command(line)
+    return False
+
+def original_clean_macos_file(input_path, output_path, reduce_empty_lines):
+    with open(input_path, 'r') as f:
+        lines = f.readlines()
+    kept_lines = []
+    removed_lines = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if original_is_section_border(line) or original_is_section_title(lines, i) or not original_is_comment(line):
+            kept_lines.append(line)
+            i += 1
+            continue
+        comment_block = [line]
+        j = i + 1
+        while j < len(lines):
+            next_line = lines[j]
+            if not next_line.strip() or not original_is_comment(next_line) or original_is_section_title(lines, j):
+                break
+            comment_block.append(next_line)
+            j += 1
+        if original_should_keep_comment_block(lines, j - 1):
+            kept_lines.extend(comment_block)
+        else:
+            removed_lines.extend([(i + idx + 1, line) for idx, line in enumerate(comment_block)])
+        i = j
+    kept_lines = reduce_empty_lines(kept_lines)
+    with open(output_path, 'w') as f:
+        f.writelines(kept_lines)
+    return kept_lines, removed_lines
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+def main():
+    args = parse_args()
+    script = load_script('remove-orphaned-comments')
+    rng = random.Random(args.seed)
+
+    print('    lines    tokenize       clean    original   clean µs/line   removed')
+    with tempfile.TemporaryDirectory() as tmp:
+        source, cleaned, reference = (Path(tmp) / name for name in ('.macos', 'clean', 'original'))
+        for count in (int(size) for size in args.sizes.split(',')):
+            source.write_text(synthetic_macos(count, rng))
+            tokenize_time, _ = timed(lambda: sum(1 for _ in read_records(source)))
+            clean_time, (_, removed) = timed(script.clean_macos_file, source, cleaned)
+            original = '         -'
+            if not args.skip_original:
+                original_time, (_, original_removed) = timed(original_clean_macos_file, source, reference,
+                                                             script.reduce_empty_lines)
+                if cleaned.read_bytes() != reference.read_bytes() or removed != original_removed:
+                    sys.exit(f"FAIL: clean_macos_file and the original differ on {count} lines")
+                original = f"{original_time:9.3f}s"
+            print(f"  {count:7d}  {tokenize_time:9.3f}s  {clean_time:9.3f}s  {original}"
+                  f"  {clean_time / count * 1e6:13.2f}  {len(removed):8d}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Guard the load time of the readable_yaml stdout callback
+
+ansible loads the stdout callback for every run, so the plugin must not pull in
+anything the default callback (its base class) does not already load. This
+imports ansible.plugins.callback.default, then the plugin, in fresh interpreters
+under `python -X importtime`, and reports the modules and time the plugin adds.
+
+Exits 1 if the plugin imports one of the deferred modules at load time, or if
+its median load time exceeds the budget.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PLUGIN = Path(__file__).resolve().parent.parent / 'callback_plugins/readable_yaml.py'
+
+# Only needed once a result is rendered (or a profile/spill file written)
+DEFERRED = ('yaml', 'csv', 'hashlib', 'ansible._internal._yaml._dumper', 'ansible.parsing.yaml.dumper')
+
+BASELINE = 'import ansible.plugins.callback.default'
+LOAD = '''
+import importlib.util, sys, time
+import ansible.plugins.callback.default
+spec = importlib.util.spec_from_file_location('readable_yaml', sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+started = time.perf_counter()
+spec.loader.exec_module(module)
+print(time.perf_counter() - started)
+'''
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--plugin', type=Path, default=PLUGIN, help='plugin file (default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=7, help='interpreters to start (default: %(default)s)')
+    parser.add_argument('--budget-ms', type=float, default=0.75,
+                        help='maximum median load time of the plugin (default: %(default)s)')
+    return parser.parse_args()
+
+def imported_modules(code, *args):
+    """{module: cumulative µs} from `python -X importtime`, plus the script's stdout"""
+    # Measure with cached bytecode, as ansible runs do; recompiling the source would dominate
+    env = {key: value for key, value in os.environ.items() if key != 'PYTHONDONTWRITEBYTECODE'}
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code, *args],
+                          capture_output=True, text=True, check=True, env=env)
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        modules[name] = int(cumulative)
+    return modules, proc.stdout
+
+def main():
+    args = parse_args()
+    baseline = set(imported_modules(BASELINE)[0])
+
+    # The first run writes the bytecode cache
+    imported_modules(LOAD, str(args.plugin))
+    load_times = []
+    extra = {}
+    for _ in range(args.runs):
+        modules, out = imported_modules(LOAD, str(args.plugin))
+        load_times.append(float(out.strip().splitlines()[-1]) * 1000)
+        extra = {name: us for name, us in modules.items() if name not in baseline}
+
+    median = statistics.median(load_times)
+    print(f"Plugin load time: median {median:.2f} ms, min {min(load_times):.2f} ms over {args.runs} runs")
+    print(f"Modules imported by the plugin beyond ansible.plugins.callback.default: {len(extra)}")
+    for name, us in sorted(extra.items(), key=lambda item: -item[1]):
+        print(f"  {us / 1000:8.2f} ms  {name}")
+
+    failures = [f"imports {name} at load time" for name in DEFERRED if name in extra]
+    if median > args.budget_ms:
+        failures.append(f"median load time {median:.2f} ms exceeds the budget of {args.budget_ms} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Check the macOS defaults managed by Ansible for drift
+
+Takes the whole `defaults` list, reads every domain's plist once (domains in
+parallel) and reports each setting as OK, DIFFERS or NOT FOUND. Settings for
+another host (currentHost/-host) are reported as SKIPPED.
+
+JSON output (--format json) has one document per machine, so the reports of
+several Macs can be collected and aggregated.
+"""
+
+import argparse
+import json
+import platform
+import socket
+import sys
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'lib'))
+from defaults_yaml import INVENTORY_DIR, load_settings  # noqa: E402
+from macos_prefs import CONTAINERS_DIR, PREFERENCES_DIR, canonical_domain, snapshot  # noqa: E402
+from snapshot_diff import typed_setting  # noqa: E402
+
+OK = 'OK'
+DIFFERS = 'DIFFERS'
+NOT_FOUND = 'NOT FOUND'
+SKIPPED = 'SKIPPED'
+
+# Colors for output
+COLORS = {OK: '\033[0;32m', DIFFERS: '\033[1;33m', NOT_FOUND: '\033[0;31m', SKIPPED: '\033[0;34m'}
+NC = '\033[0m'
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--defaults-file', type=Path, default=INVENTORY_DIR / 'group_vars/macs/defaults.yml',
+                        help='YAML file with the defaults list (default: %(default)s)')
+    parser.add_argument('--prefs-dir', type=Path, default=PREFERENCES_DIR,
+                        help='preferences directory (default: %(default)s)')
+    parser.add_argument('--format', choices=('text', 'json'), default='text', help='output format (default: text)')
+    parser.add_argument('--only-drift', action='store_true', help='leave OK settings out of the report')
+    return parser.parse_args()
+
+def check_drift(settings, prefs_dir=PREFERENCES_DIR, containers_dir=CONTAINERS_DIR):
+    """One report entry per setting, reading each domain once"""
+    domains = {canonical_domain(s['domain']) for s in settings if not s.get('host')}
+    current = snapshot(domains, prefs_dir, containers_dir)
+
+    report = []
+    for setting in settings:
+        expected = typed_setting(setting)
+        entry = {
+            'domain': setting['domain'],
+            'key': setting['key'],
+            'name': setting.get('name', setting['key']),
+            'expected': expected,
+            'actual': None,
+        }
+        if setting.get('host'):
+            entry['status'] = SKIPPED
+        else:
+            actual = current.get(canonical_domain(setting['domain']), {}).get(setting['key'])
+            entry['actual'] = actual
+            if actual is None:
+                entry['status'] = NOT_FOUND
+            elif actual == expected:
+                entry['status'] = OK
+            else:
+                entry['status'] = DIFFERS
+        report.append(entry)
+    return report
+
+def print_report(report, only_drift):
+    for entry in report:
+        status = entry['status']
+        if only_drift and status == OK:
+            continue
+        print(f"{entry['name']}... {COLORS[status]}{status}{NC}")
+        if status != OK:
+            print(f"  Domain: {entry['domain']}")
+            print(f"  Key: {entry['key']}")
+        if status == DIFFERS:
+            actual, expected = entry['actual'], entry['expected']
+            print(f"  Current value: {actual['value']!r} ({actual['type']})")
+            print(f"  Expected: {expected['value']!r} ({expected['type']})")
+
+def main():
+    args = parse_args()
+
+    if not args.defaults_file.exists():
+        print(f"Error: {args.defaults_file} not found", file=sys.stderr)
+        sys.exit(2)
+
+    settings = load_settings(args.defaults_file)
+    containers_dir = CONTAINERS_DIR if args.prefs_dir == PREFERENCES_DIR else None
+    report = check_drift(settings, args.prefs_dir, containers_dir)
+    summary = Counter(entry['status'] for entry in report)
+
+    if args.format == 'json':
+        json.dump({
+            'host': socket.gethostname(),
+            'macos_version': platform.mac_ver()[0] or None,
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'defaults_file': str(args.defaults_file),
+            'summary': {status: summary[status] for status in (OK, DIFFERS, NOT_FOUND, SKIPPED)},
+            'settings': [entry for entry in report if not (args.only_drift and entry['status'] == OK)],
+        }, sys.stdout, indent=1, ensure_ascii=False)
+        sys.stdout.write('\n')
+    else:
+        print_report(report, args.only_drift)
+        print()
+        print(f"Checked {len(report)} settings: " +
+              ", ".join(f"{summary[status]} {status}" for status in (OK, DIFFERS, NOT_FOUND, SKIPPED)))
+
+    # Non-zero exit on drift, so the checker can gate scripts and CI jobs
+    sys.exit(1 if summary[DIFFERS] or summary[NOT_FOUND] else 0)
+
+if __name__ == '__main__':
+    main()
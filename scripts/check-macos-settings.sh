@@ -23,36 +23,6 @@ YELLOW='\033[1;33m'
 BLUE='\033[0;34m'
 NC='\033[0m' # No Color
 
-check_defaults_setting() {
-    local domain=$1
-    local key=$2
-    local expected=$3
-    local name=$4
-
-    echo -n "Checking: ${name}..."
-
-    # Try to read the setting
-    actual=$(defaults read "${domain}" "${key}" 2>/dev/null || echo "NOT_FOUND")
-
-    if [ "${actual}" = "NOT_FOUND" ]; then
-        echo -e " ${RED}NOT FOUND${NC}"
-        echo "  Domain: ${domain}"
-        echo "  Key: ${key}"
-        return 1
-    else
-        echo -e " ${GREEN}EXISTS${NC}"
-        echo "  Current value: ${actual}"
-        if [ -n "${expected}" ]; then
-            if [ "${actual}" = "${expected}" ]; then
-                echo -e "  ${GREEN}✓ Matches expected value${NC}"
-            else
-                echo -e "  ${YELLOW}! Differs from expected: ${expected}${NC}"
-            fi
-        fi
-        return 0
-    fi
-}
-
 check_command_exists() {
     local cmd=$1
     local name=$2
@@ -91,44 +61,9 @@ echo "1. Checking defaults.yml Settings"
 echo "=================================================="
 echo ""
 
-# From inventories/group_vars/macs/defaults.yml
-check_defaults_setting "com.apple.applicationaccess" "allowAutoUnlock" "1" "Apple Watch Unlock"
-echo ""
-
-check_defaults_setting "com.apple.dock" "tilesize" "30" "Dock Tile Size"
-echo ""
-
-check_defaults_setting "com.apple.dock" "orientation" "bottom" "Dock Position"
-echo ""
-
-check_defaults_setting "com.apple.dock" "autohide" "0" "Dock Auto-Hide (disabled)"
-echo ""
-
-check_defaults_setting "com.apple.screensaver" "idleTime" "0" "Screensaver Idle Time"
-echo ""
-
-check_defaults_setting "com.apple.finder" "ShowHardDrivesOnDesktop" "1" "Show Hard Drives on Desktop"
-echo ""
-
-check_defaults_setting "com.apple.finder" "ShowExternalHardDrivesOnDesktop" "1" "Show External Drives on Desktop"
-echo ""
-
-check_defaults_setting "com.apple.finder" "ShowRemovableMediaOnDesktop" "1" "Show Removable Media on Desktop"
-echo ""
-
-check_defaults_setting "com.apple.finder" "AppleShowAllFiles" "1" "Show Hidden Files"
-echo ""
-
-check_defaults_setting "com.apple.finder" "AppleShowAllExtensions" "1" "Show All File Extensions"
-echo ""
-
-check_defaults_setting "com.apple.finder" "ShowStatusBar" "1" "Show Finder Status Bar"
-echo ""
-
-check_defaults_setting "com.apple.finder" "ShowPathbar" "1" "Show Finder Path Bar"
-echo ""
-
-check_defaults_setting "com.apple.TextEdit" "RichText" "0" "TextEdit Plain Text Mode"
+# Whole defaults list from inventories/group_vars/macs/defaults.yml, one read per domain
+# (--format json gives a machine-readable report for collecting across Macs)
+python3 "$(dirname "$0")/check-macos-drift.py" --only-drift
 echo ""
 
 echo "=================================================="
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Check that readable_yaml renders results exactly like the original callback
+
+The callback emits results with libyaml (CEmitter) from a copy-on-write view of
+the result. Its output must stay byte-identical to the original implementation,
+which deep-copied every result with module_response_deepcopy and emitted it with
+the pure-Python yaml emitter. That implementation is kept below as the reference.
+
+Renders a set of representative results (multi-line command output with tabs,
+carriage returns and control characters, unicode, nested internal keys, loop
+results, containers the lazy view cannot copy) plus seeded random results through
+both and compares them, at the default verbosity and at -vvv.
+
+Exits 1 on the first difference, if a result was modified by rendering, or if the
+libyaml emitter is not in use (the fast path would not be tested).
+"""
+
+import argparse
+import difflib
+import json
+import random
+import re
+import string
+import sys
+from collections import UserDict, UserList
+from copy import deepcopy
+from pathlib import Path
+
+PLUGINS = Path(__file__).resolve().parent.parent / 'callback_plugins'
+
+# Characters random strings are drawn from: the block scalar triggers, everything the
+# sanitizer removes, tabs for expandtabs, trailing spaces and some non-ASCII text
+ALPHABET = (string.ascii_letters + string.digits + ' ' * 8 + '\n' * 6 + '\t\r\x0b\x0c\x00\x07\x1b\x7f\x85\x9f\xa0'
+            '\u001c\u001d\u001e\u2028\u2029' + 'äöüéß€✓—中文' + ':#-{}[]&*!|>\'"%@`,?')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--random', type=int, default=1000,
+                        help='random results to compare in addition to the fixed ones (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random results (default: %(default)s)')
+    return parser.parse_args()
+
+def reference_dump_results(result, verbosity, keep_invocation=False):
+    """CallbackModule._dump_results as it was before the fast path"""
+    import yaml
+    from ansible.module_utils.common.text.converters import to_text
+    from ansible.plugins.callback import strip_internal_keys, module_response_deepcopy
+    from ansible._internal._yaml._dumper import AnsibleDumper
+
+    class ReadableDumper(AnsibleDumper):
+        def represent_scalar(self, tag, value, style=None):
+            if style is None and isinstance(value, str):
+                if any(c in value for c in u"\u000a\u000d\u001c\u001d\u001e\u0085\u2028\u2029"):
+                    style = '|'
+                    value = value.rstrip()
+                    value = ''.join(x for x in value if x in string.printable or ord(x) >= 0xA0)
+                    value = value.expandtabs()
+                    value = re.sub(r'[\x0b\x0c\r]', '', value)
+                    value = re.sub(r' +\n', '\n', value)
+                else:
+                    style = self.default_style
+            node = yaml.representer.ScalarNode(tag, value, style=style)
+            if self.alias_key is not None:
+                self.represented_objects[self.alias_key] = node
+            return node
+
+    class PureReadableDumper(yaml.emitter.Emitter, yaml.serializer.Serializer, ReadableDumper):
+        """ReadableDumper with the pure-Python emitter, even where AnsibleDumper is a CSafeDumper"""
+
+        def __init__(self, stream, default_style=None, default_flow_style=False, canonical=None, indent=None,
+                     width=None, allow_unicode=None, line_break=None, encoding=None, explicit_start=None,
+                     explicit_end=None, version=None, tags=None, sort_keys=True):
+            yaml.emitter.Emitter.__init__(self, stream, canonical=canonical, indent=indent, width=width,
+                                          allow_unicode=allow_unicode, line_break=line_break)
+            yaml.serializer.Serializer.__init__(self, encoding=encoding, explicit_start=explicit_start,
+                                                explicit_end=explicit_end, version=version, tags=tags)
+            yaml.representer.SafeRepresenter.__init__(self, default_style=default_style,
+                                                      default_flow_style=default_flow_style, sort_keys=sort_keys)
+            yaml.resolver.Resolver.__init__(self)
+
+    if result.get('_ansible_no_log', False):
+        return json.dumps(dict(censored="The output has been hidden due to the fact that 'no_log: true' was specified for this result"))
+
+    abridged_result = strip_internal_keys(module_response_deepcopy(result))
+
+    if not keep_invocation and verbosity < 3 and 'invocation' in result:
+        del abridged_result['invocation']
+
+    if verbosity < 3 and 'diff' in result:
+        del abridged_result['diff']
+
+    if 'exception' in abridged_result:
+        del abridged_result['exception']
+
+    dumped = ''
+
+    if 'changed' in abridged_result:
+        dumped += 'changed=' + str(abridged_result['changed']).lower() + ' '
+        del abridged_result['changed']
+
+    if 'skipped' in abridged_result:
+        dumped += 'skipped=' + str(abridged_result['skipped']).lower() + ' '
+        del abridged_result['skipped']
+
+    if 'stdout' in abridged_result and 'stdout_lines' in abridged_result:
+        abridged_result['stdout_lines'] = '<omitted>'
+
+    if 'stderr' in abridged_result and 'stderr_lines' in abridged_result:
+        abridged_result['stderr_lines'] = '<omitted>'
+
+    if abridged_result:
+        dumped += '\n'
+        dumped += to_text(yaml.dump(abridged_result, allow_unicode=True, width=1000, Dumper=PureReadableDumper, default_flow_style=False))
+
+    return '\n  '.join(dumped.split('\n')).rstrip()
+
+def command_result(stdout, stderr='', rc=0, changed=True):
+    return {
+        'changed': changed, 'rc': rc, 'cmd': ['brew', 'upgrade'], 'start': '2024-05-02 10:00:00.000000',
+        'stdout': stdout, 'stdout_lines': stdout.splitlines(), 'stderr': stderr, 'stderr_lines': stderr.splitlines(),
+        'invocation': {'module_args': {'_raw_params': 'brew upgrade', '_uses_shell': False, 'chdir': None}},
+        '_ansible_no_log': False, '_ansible_verbose_always': True,
+    }
+
+def fixed_results():
+    """(name, result) of the result shapes the playbook produces"""
+    brew = '\n'.join(f"==> Upgrading formula-{i}\n  1.{i}.0 -> 1.{i}.1\t\t(bottle)\r\n\x1b[32m✓\x1b[0m done   "
+                     for i in range(200))
+    defaults_loop = {
+        'changed': True, 'msg': 'All items completed', '_ansible_no_log': False,
+        'results': [{
+            'changed': i % 3 == 0, 'item': {'domain': 'com.apple.dock', 'key': f"key{i}", 'type': 'bool',
+                                             'value': bool(i % 2)},
+            'ansible_loop_var': 'item', '_ansible_item_label': f"key{i}", '_ansible_no_log': False,
+            'invocation': {'module_args': {'domain': 'com.apple.dock', 'key': f"key{i}", 'state': 'present'}},
+        } for i in range(90)],
+    }
+    yield 'command output', command_result(brew, stderr='Warning: something\n\tindented\x0c\n')
+    yield 'defaults loop', defaults_loop
+    yield 'failed with exception', {
+        'failed': True, 'msg': 'MODULE FAILURE\nSee stdout/stderr for the exact error', 'rc': 1,
+        'exception': 'Traceback (most recent call last):\n  File "x", line 1\nValueError', 'module_stdout': '',
+        'module_stderr': 'Shared connection closed.\r\n', '_ansible_no_log': False,
+    }
+    yield 'diff', {'changed': True, 'diff': [{'before': 'a\n', 'after': 'b\n', 'before_header': 'x'}],
+                   'dest': '/Users/me/.zshrc', '_ansible_diff': True}
+    yield 'skipped', {'changed': False, 'skipped': True, 'skip_reason': 'Conditional result was False',
+                      'false_condition': "ansible_os_family == 'Darwin'"}
+    yield 'no_log', {'changed': True, '_ansible_no_log': True, 'secret': 'hunter2'}
+    yield 'only changed', {'changed': False, '_ansible_no_log': False}
+    yield 'scalars', {'changed': False, 'int': 3, 'float': 1.5, 'none': None, 'bool': True, 'empty': '',
+                      'colon': 'a: b', 'quote': "it's", 'leading space': ' x', 'number string': '010',
+                      'yes': 'yes', 'unicode': 'Grüße — 中文 ✓', 'line separator': 'a\u2028b', 'nel': 'a\x85b'}
+    yield 'nested internal keys', {'changed': True, 'results': [
+        {'_ansible_item_label': 'a', 'nested': {'_ansible_x': 1, 'keep': [{'_ansible_y': 2, 'z': 'v\n'}]}},
+        {'plain': [1, 2, {'deep': {'deeper': 'x'}}]},
+    ], 'ansible_facts': {'discovered_interpreter_python': '/usr/bin/python3'}}
+    yield 'stdout without stdout_lines', {'changed': True, 'stdout': 'one\ntwo', 'stderr': 'three'}
+    # UserDict/UserList are not dict/list: the lazy view raises _ExoticValue and the
+    # callback falls back to deep-copying the whole result
+    yield 'exotic containers', {'changed': True, 'mapping': UserDict({'a': 1, '_ansible_x': 2, 'b': 'x\ny'}),
+                                'sequence': UserList([{'_ansible_y': 1, 'c': 2}]), '_ansible_no_log': False}
+
+def random_string(rng):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.choice((0, 1, 5, 20, 80, 400))))
+
+def random_value(rng, depth):
+    kind = rng.random()
+    if depth > 3 or kind < 0.55:
+        return rng.choice((random_string(rng), random_string(rng), rng.randint(-5, 5000), rng.random() * 100,
+                           True, False, None))
+    if kind < 0.8:
+        return {random_key(rng): random_value(rng, depth + 1) for _ in range(rng.randint(0, 6))}
+    return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 6))]
+
+def random_key(rng):
+    return rng.choice(('changed', 'skipped', 'stdout', 'stdout_lines', 'stderr', 'stderr_lines', 'invocation',
+                       'diff', 'exception', 'msg', 'item', '_ansible_no_log', '_ansible_item_label',
+                       '_ansible_verbose_always', 'results', 'rc')) if rng.random() < 0.4 else \
+        ''.join(rng.choice(string.ascii_lowercase + '_ -:') for _ in range(rng.randint(1, 12)))
+
+def random_results(count, seed):
+    rng = random.Random(seed)
+    for index in range(count):
+        result = {random_key(rng): random_value(rng, 1) for _ in range(rng.randint(1, 10))}
+        result['_ansible_no_log'] = rng.random() < 0.02
+        yield f"random #{index}", result
+
+def load_callback():
+    from ansible.plugins.loader import callback_loader
+
+    callback_loader.add_directory(str(PLUGINS))
+    callback = callback_loader.get('readable_yaml')
+    callback.set_options()
+    return callback
+
+def main():
+    args = parse_args()
+    callback = load_callback()
+    plugin = sys.modules[type(callback).__module__]
+
+    from yaml.cyaml import CEmitter
+
+    if not issubclass(plugin.dumper_classes()[1], CEmitter):
+        sys.exit('FAIL: PyYAML has no libyaml bindings, the CEmitter path cannot be checked')
+
+    checked = fallbacks = 0
+    for name, result in [*fixed_results(), *random_results(args.random, args.seed)]:
+        try:
+            plugin._strip_internal_view(result)
+            exotic = False
+        except plugin._ExoticValue:
+            # strip_internal_keys edits containers the deep copy does not copy, as it always did
+            exotic = True
+            fallbacks += 1
+        for verbosity in (0, 3):
+            callback._display.verbosity = verbosity
+            for keep_invocation in (False, True):
+                before = deepcopy(result)
+                expected = reference_dump_results(deepcopy(result), verbosity, keep_invocation)
+                actual = callback._dump_results(result, keep_invocation=keep_invocation)
+                if actual != expected:
+                    diff = difflib.unified_diff(expected.splitlines(), actual.splitlines(), 'reference', 'readable_yaml',
+                                                lineterm='')
+                    print('\n'.join(diff))
+                    sys.exit(f"FAIL: {name} (verbosity {verbosity}, keep_invocation {keep_invocation}) differs")
+                if not exotic and result != before:
+                    sys.exit(f"FAIL: rendering {name} modified the result")
+                checked += 1
+
+    if not fallbacks:
+        sys.exit('FAIL: no result took the deep-copy fallback')
+    print(f"{checked} renderings identical to the reference ({fallbacks} results through the deep-copy fallback)")
+
+if __name__ == '__main__':
+    main()
@@ -6,51 +6,46 @@ Clean up .macos script by removing:
 3. Mail settings (9 lines - domain doesn't exist)
 """
 
+import sys
 from pathlib import Path
-import re
 
-def should_keep_line(line, in_safari_section=False, in_mail_section=False):
-    """Determine if a line should be kept"""
-    stripped = line.strip()
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'lib'))
+from macos_script import BLANK, LiteralMatcher, read_records  # noqa: E402
+
+# Domains that don't exist anymore
+REMOVED_DOMAINS = LiteralMatcher(('com.apple.Safari', 'com.apple.mail'))
 
+def should_keep_record(record):
+    """Determine if a line should be kept"""
     # Keep empty lines and section headers
-    if not stripped or stripped.startswith('###'):
+    if record.kind == BLANK or record.stripped.startswith('###'):
         return True
 
     # Remove commented-out defaults write commands
-    if re.match(r'^\s*#\s*defaults write', line):
+    if record.is_commented_defaults_write:
         return False
 
-    # Remove Safari settings (domain doesn't exist)
-    if 'defaults write com.apple.Safari' in line:
-        return False
-
-    # Remove Mail settings (domain doesn't exist)
-    if 'defaults write com.apple.mail' in line:
+    # Remove Safari and Mail settings (domains don't exist)
+    if record.writes_domain(REMOVED_DOMAINS):
         return False
 
     # Keep everything else
     return True
 
 def clean_macos_file(input_path, output_path):
-    """Clean .macos file and write to output"""
-    kept_lines = []
+    """Clean .macos file and write to output, streaming line by line"""
+    kept_count = 0
     removed_lines = []
-    line_num = 0
 
-    with open(input_path, 'r') as f:
-        for line in f:
-            line_num += 1
-            if should_keep_line(line):
-                kept_lines.append(line)
+    with open(output_path, 'w') as out:
+        for record in read_records(input_path):
+            if should_keep_record(record):
+                out.write(record.line)
+                kept_count += 1
             else:
-                removed_lines.append((line_num, line.strip()))
-
-    # Write cleaned file
-    with open(output_path, 'w') as f:
-        f.writelines(kept_lines)
+                removed_lines.append((record.lineno, record.stripped))
 
-    return kept_lines, removed_lines
+    return kept_count, removed_lines
 
 def main():
     input_file = Path.home() / 'development/github/tuxpeople/dotfiles/.macos'
@@ -63,8 +58,8 @@ def main():
 
     kept, removed = clean_macos_file(input_file, output_file)
 
-    print(f"Original lines: {len(kept) + len(removed)}")
-    print(f"Kept lines: {len(kept)}")
+    print(f"Original lines: {kept + len(removed)}")
+    print(f"Kept lines: {kept}")
     print(f"Removed lines: {len(removed)}")
     print()
 
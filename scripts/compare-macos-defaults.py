@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Compare two defaults snapshots and list the changed settings
+
+Each side is a JSON snapshot written by export-macos-defaults.py or a YAML
+file with an Ansible `defaults` list (e.g. inventories/group_vars/macs/defaults.yml).
+Without a second file the baseline is compared with the live preferences.
+When a side is a defaults list, only the settings it manages are compared,
+so unmanaged keys of a snapshot or the live preferences are not reported.
+
+Formats:
+  text   one line per change (default)
+  json   typed changelist
+  yaml   `defaults:` entries for the added/changed scalar settings
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'lib'))
+from macos_prefs import CONTAINERS_DIR, IMPORTANT_DOMAINS, PREFERENCES_DIR, load_snapshot, snapshot  # noqa: E402
+from macos_script import convert_to_ansible_yaml  # noqa: E402
+from snapshot_diff import (ADDED, CHANGED, REMOVED, change_to_setting, defaults_list_snapshot, diff_snapshots,  # noqa: E402
+                           managed_keys)
+
+MARKERS = {ADDED: '+ NEW:', REMOVED: '- REMOVED:', CHANGED: '~ CHANGED:'}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('baseline', type=Path, help='baseline snapshot (.json) or defaults list (.yml)')
+    parser.add_argument('current', type=Path, nargs='?',
+                        help='current snapshot or defaults list (default: read the live preferences)')
+    parser.add_argument('--prefs-dir', type=Path, default=PREFERENCES_DIR,
+                        help='preferences directory for the live read (default: %(default)s)')
+    parser.add_argument('--format', choices=('text', 'json', 'yaml'), default='text',
+                        help='output format (default: text)')
+    return parser.parse_args()
+
+def is_defaults_list(path):
+    return path.suffix in ('.yml', '.yaml')
+
+def load_side(path):
+    if is_defaults_list(path):
+        from defaults_yaml import load_settings
+        return defaults_list_snapshot(load_settings(path))
+    return load_snapshot(path)
+
+def compact(setting):
+    return json.dumps(setting['value'], ensure_ascii=False) if setting else '-'
+
+def write_yaml(changes, out):
+    out.write("defaults:\n")
+    for change in changes:
+        setting = change_to_setting(change)
+        if setting is not None:
+            out.write(convert_to_ansible_yaml(setting) + "\n\n")
+        elif change.action == REMOVED:
+            out.write(f"  # Removed: {change.domain} {change.key}\n")
+        else:
+            out.write(f"  # {change.domain} {change.key} -{change.type} ... (manual edit needed)\n")
+
+def main():
+    args = parse_args()
+
+    if not args.baseline.exists():
+        print(f"Error: {args.baseline} not found", file=sys.stderr)
+        sys.exit(1)
+
+    baseline = load_side(args.baseline)
+    # A defaults list only speaks for the settings it manages
+    keys = managed_keys(baseline) if is_defaults_list(args.baseline) else None
+    if args.current is not None:
+        current = load_side(args.current)
+        if is_defaults_list(args.current):
+            keys = managed_keys(current) | (keys or set())
+    else:
+        containers_dir = CONTAINERS_DIR if args.prefs_dir == PREFERENCES_DIR else None
+        domains = set(baseline) if keys is not None else set(baseline) | set(IMPORTANT_DOMAINS)
+        current = snapshot(domains, args.prefs_dir, containers_dir)
+
+    changes = diff_snapshots(baseline, current, keys=keys)
+
+    if args.format == 'json':
+        json.dump([change.to_dict() for change in changes], sys.stdout, indent=1, ensure_ascii=False)
+        sys.stdout.write('\n')
+    elif args.format == 'yaml':
+        write_yaml(changes, sys.stdout)
+    else:
+        domain = None
+        for change in changes:
+            if change.domain != domain:
+                domain = change.domain
+                print(f"\nDomain: {domain}")
+            if change.action == CHANGED:
+                print(f"{MARKERS[change.action]} {change.key} = {compact(change.old)} -> {compact(change.new)}")
+            else:
+                print(f"{MARKERS[change.action]} {change.key} = {compact(change.old or change.new)}")
+        print()
+
+    print(f"Total changes: {len(changes)}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
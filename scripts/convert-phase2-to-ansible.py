@@ -4,75 +4,24 @@ Convert Phase 2 settings from .macos to Ansible YAML format
 Phase 2: App-specific but stable settings
 """
 
-import re
+import argparse
 import sys
 from pathlib import Path
 
-def parse_defaults_write(line):
-    """Parse a defaults write command and return dict with components"""
-    line = line.strip()
-    if line.startswith('#') or not line.startswith('defaults write'):
-        return None
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'lib'))
+from macos_script import INDEX_DIR, ConversionIndex, convert_to_ansible_yaml, iter_settings, read_records  # noqa: E402
 
-    # Split on whitespace, handling quoted strings
-    parts = re.findall(r'[^\s"]+|"[^"]*"', line)
-
-    if len(parts) < 4:
-        return None
-
-    domain = parts[2]
-    key = parts[3]
-
-    # Determine type and value
-    type_flag = None
-    value = None
-
-    if len(parts) >= 6:
-        type_flag = parts[4]
-        value = parts[5].strip('"')
-    elif len(parts) == 5:
-        value = parts[4].strip('"')
-
-    # Map defaults types to Ansible types
-    ansible_type = None
-    if type_flag == '-bool':
-        ansible_type = 'bool'
-    elif type_flag == '-int':
-        ansible_type = 'int'
-    elif type_flag == '-string':
-        ansible_type = 'string'
-    elif type_flag == '-float':
-        ansible_type = 'float'
-    elif type_flag == '-array':
-        ansible_type = 'array'
-    elif type_flag == '-dict-add':
-        return None  # Complex, skip
-
-    # Generate description from key name
-    description = re.sub(r'([a-z])([A-Z])', r'\1 \2', key)
-    description = description.replace('_', ' ').strip()
-
-    return {
-        'domain': domain,
-        'key': key,
-        'type': ansible_type,
-        'value': value,
-        'description': description,
-        'original_line': line
-    }
-
-def convert_to_ansible_yaml(setting):
-    """Convert setting dict to Ansible YAML format"""
-    lines = []
-    lines.append(f"  - domain: {setting['domain']}")
-    lines.append(f"    key: {setting['key']}")
-    lines.append(f"    name: {setting['description']}")
-    if setting['type']:
-        lines.append(f"    type: {setting['type']}")
-    lines.append(f"    value: '{setting['value']}'")
-    return '\n'.join(lines)
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--incremental', action='store_true',
+                        help='only emit settings whose .macos line changed since the last run (delta YAML)')
+    parser.add_argument('--index', type=Path, default=INDEX_DIR / 'convert-phase2-to-ansible.json',
+                        help='change index used by --incremental (default: %(default)s)')
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    index = ConversionIndex(args.index) if args.incremental else None
     macos_file = Path.home() / 'development/github/tuxpeople/dotfiles/.macos'
 
     if not macos_file.exists():
@@ -81,6 +30,8 @@ def main():
 
     print("# Phase 2 settings from .macos")
     print("# App-specific but stable settings")
+    if index is not None:
+        print("# Incremental: only settings changed since the last run")
     print()
     print("phase2_settings:")
 
@@ -97,19 +48,27 @@ def main():
 
     settings_count = 0
 
-    with open(macos_file, 'r') as f:
-        for line_num, line in enumerate(f, 1):
-            setting = parse_defaults_write(line)
-            if not setting:
-                continue
-
-            if setting['domain'] not in target_domains:
-                continue
-
-            print(convert_to_ansible_yaml(setting))
-            print(f"    # Source: .macos line {line_num}")
-            print()
-            settings_count += 1
+    # An incremental run only parses the lines that are not in the index
+    settings = index.changed_settings(macos_file) if index is not None else iter_settings(read_records(macos_file))
+    for line_num, setting in settings:
+        if setting['domain'] not in target_domains:
+            continue
+
+        # Unchanged since the last incremental run
+        if index is not None and not index.add(setting):
+            continue
+
+        print(convert_to_ansible_yaml(setting))
+        print(f"    # Source: .macos line {line_num}")
+        print()
+        settings_count += 1
+
+    if index is not None:
+        removed = index.removed()
+        for entry in removed:
+            print(f"  # Removed: {entry['domain']} {entry['key']} ({entry['line']})")
+        index.save()
+        print(f"# Incremental: {len(removed)} settings removed since last run", file=sys.stderr)
 
     print(f"\n# Total Phase 2: {settings_count} settings", file=sys.stderr)
 
@@ -0,0 +1,126 @@
+"""
+YAML helpers and a (domain, key) index for the Ansible `defaults` lists
+
+Uses the libyaml-backed CSafeLoader/CSafeDumper when PyYAML was built with
+them. Inventory files may contain inline `!vault` values, which are loaded
+as opaque placeholders so that the rest of the file stays readable.
+"""
+
+from collections import namedtuple
+from pathlib import Path
+
+import yaml
+
+REPO_DIR = Path(__file__).resolve().parents[2]
+INVENTORY_DIR = REPO_DIR / 'inventories'
+
+TRUE_VALUES = ('true', 'yes', 'on', '1')
+FALSE_VALUES = ('false', 'no', 'off', '0')
+
+
+class Loader(getattr(yaml, 'CSafeLoader', yaml.SafeLoader)):
+    """Safe loader that tolerates Ansible `!vault` tags"""
+
+
+Loader.add_constructor('!vault', lambda loader, node: '<vault>')
+
+Dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+
+def load_yaml(path):
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=Loader)
+
+
+def dump_yaml(data, stream):
+    yaml.dump(data, stream, Dumper=Dumper, default_flow_style=False, sort_keys=False, allow_unicode=True)
+
+
+def load_settings(path):
+    """The `defaults` list of a YAML file (empty if the file has none)"""
+    data = load_yaml(path)
+    if not isinstance(data, dict):
+        return []
+    return data.get('defaults') or []
+
+
+def setting_key(setting):
+    return (setting['domain'], setting['key'])
+
+
+def setting_value(setting):
+    """(type, value) normalised the way osx_defaults interprets them, so 'true' and True compare equal"""
+    value_type = setting.get('type') or 'string'
+    value = setting.get('value')
+    try:
+        if value_type in ('bool', 'boolean'):
+            lowered = str(value).lower()
+            value = True if lowered in TRUE_VALUES else False if lowered in FALSE_VALUES else value
+            value_type = 'bool'
+        elif value_type in ('int', 'integer'):
+            value, value_type = int(value), 'int'
+        elif value_type == 'float':
+            value = float(value)
+        elif value_type == 'array' and not isinstance(value, list):
+            value = [value]
+        elif value_type == 'string':
+            value = str(value)
+    except (TypeError, ValueError):
+        pass
+    if isinstance(value, list):
+        value = tuple(str(v) for v in value)
+    elif isinstance(value, dict):
+        value = tuple(sorted((str(k), str(v)) for k, v in value.items()))
+    return value_type, value
+
+
+def iter_defaults_lists(inventory_dir=INVENTORY_DIR):
+    """(path, settings) for every group_vars/host_vars YAML file that defines a `defaults` list"""
+    # ** also matches zero directories, so this covers group_vars/all.yml-style files too
+    for pattern in ('group_vars/**/*.yml', 'host_vars/**/*.yml'):
+        for path in sorted(Path(inventory_dir).glob(pattern)):
+            try:
+                settings = load_settings(path)
+            except yaml.YAMLError:
+                continue
+            if settings:
+                yield path, settings
+
+
+Entry = namedtuple('Entry', 'path setting')
+
+
+class SettingsIndex(object):
+    """(domain, key) -> [Entry] over any number of `defaults` lists"""
+
+    def __init__(self):
+        self.entries = {}
+
+    def add_settings(self, path, settings):
+        for setting in settings:
+            self.add(path, setting)
+
+    def add(self, path, setting):
+        self.entries.setdefault(setting_key(setting), []).append(Entry(path, setting))
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        return self.entries.get(key, [])
+
+    def conflicts(self):
+        """(domain, key) pairs defined with different values/types, with their entries"""
+        for key, entries in self.entries.items():
+            if len({setting_value(entry.setting) for entry in entries}) > 1:
+                yield key, entries
+
+    @classmethod
+    def from_inventory(cls, inventory_dir=INVENTORY_DIR):
+        index = cls()
+        for path, settings in iter_defaults_lists(inventory_dir):
+            index.add_settings(path, settings)
+        return index
@@ -0,0 +1,109 @@
+#!/usr/bin/env bash
+#
+# Fleet Mode Functions
+# Used by: macapply, macupdate
+#
+# Runs a playbook against a host pattern in one ansible-playbook process with
+# the free strategy, so every Mac works through the play at its own pace and
+# the whole run takes as long as the slowest host. The readable_yaml callback
+# writes the per-host state to the fleet directory:
+#
+#   <host>.log      task log of one host
+#   progress.tsv    current task and counters of every host (live)
+#   summary.json    final per-host stats
+#   ansible.log     complete playbook output
+#
+# Usage:
+#   source "$(dirname "$0")/lib/fleet.sh"
+#   run_fleet plays/update.yml 'macs:!test_mac' macupdate [ansible-playbook args...]
+#
+
+FLEET_BASE_DIR="${FLEET_BASE_DIR:-${HOME}/.ansible/fleet}"
+FLEET_REFRESH="${FLEET_REFRESH:-2}"
+
+# Color codes (define if not already set)
+RED="${RED:-\033[0;31m}"
+GREEN="${GREEN:-\033[0;32m}"
+YELLOW="${YELLOW:-\033[1;33m}"
+BLUE="${BLUE:-\033[0;34m}"
+NC="${NC:-\033[0m}"
+
+# Print the progress table of a fleet directory
+fleet_table() {
+    local fleet_dir="$1"
+    local progress="${fleet_dir}/progress.tsv"
+
+    [[ -f "${progress}" ]] || return 0
+    awk -F '\t' -v red="${RED}" -v green="${GREEN}" -v yellow="${YELLOW}" -v nc="${NC}" '
+        NR == 1 { printf "%-24s %-12s %5s %8s %7s %8s  %s\n", $1, $2, $3, $4, $5, $6, $8; next }
+        {
+            color = ($2 == "failed" || $2 == "unreachable") ? red : ($2 == "done" ? green : yellow)
+            printf "%-24s %s%-12s%s %5s %8s %7s %8s  %s\n", $1, color, $2, nc, $3, $4, $5, $6, substr($8, 1, 60)
+        }' "${progress}"
+}
+
+# Redraw the live progress view (terminals only, logs stay readable otherwise)
+fleet_render() {
+    local fleet_dir="$1"
+    local started="$2"
+
+    [[ -t 1 ]] || return 0
+    printf '\033[H\033[2J'
+    echo -e "${BLUE}Fleet run${NC} $(basename "${fleet_dir}")  ($(( $(date +%s) - started ))s, logs: ${fleet_dir})"
+    echo ""
+    fleet_table "${fleet_dir}"
+}
+
+# Final summary: table, hosts that need attention and where to find their logs
+fleet_summary() {
+    local fleet_dir="$1"
+    local progress="${fleet_dir}/progress.tsv"
+
+    echo ""
+    echo -e "${BLUE}=== Fleet Summary ===${NC}"
+    fleet_table "${fleet_dir}"
+    echo ""
+
+    if [[ -f "${progress}" ]]; then
+        awk -F '\t' 'NR > 1 && $2 != "done" { print $1 }' "${progress}" | while read -r host; do
+            echo -e "${RED}✗ ${host}${NC}: ${fleet_dir}/${host}.log"
+        done
+    else
+        # The play never reached a host (inventory, vault or syntax error)
+        tail -n 20 "${fleet_dir}/ansible.log"
+    fi
+    echo "Full output: ${fleet_dir}/ansible.log"
+}
+
+# Run a playbook against a host pattern, showing live per-host progress
+# Returns the exit code of ansible-playbook
+run_fleet() {
+    local playbook="$1"
+    local pattern="$2"
+    local name="$3"
+    shift 3
+
+    FLEET_DIR="${FLEET_BASE_DIR}/${name}-$(date +%Y%m%d-%H%M%S)"
+    mkdir -p "${FLEET_DIR}"
+
+    ANSIBLE_STRATEGY=free \
+    ANSIBLE_READABLE_YAML_FLEET_DIR="${FLEET_DIR}" \
+    ANSIBLE_FORCE_COLOR=false \
+        ansible-playbook "${playbook}" -i inventories -l "${pattern}" "$@" \
+        > "${FLEET_DIR}/ansible.log" 2>&1 < /dev/null &
+    local pid=$!
+    local started
+    started=$(date +%s)
+
+    while kill -0 "${pid}" 2>/dev/null; do
+        fleet_render "${FLEET_DIR}" "${started}"
+        sleep "${FLEET_REFRESH}"
+    done
+
+    local exit_code=0
+    wait "${pid}" || exit_code=$?
+
+    fleet_summary "${FLEET_DIR}"
+    echo "Duration: $(( $(date +%s) - started ))s"
+    return ${exit_code}
+}
@@ -0,0 +1,182 @@
+"""
+Direct plist access to macOS preference domains
+
+Reads the plist files behind `defaults` domains with plistlib (binary and
+XML) instead of spawning `defaults read` per domain and per key, and turns
+them into a typed snapshot:
+
+    {domain: {key: {'type': 'bool' | 'int' | 'float' | 'string' | 'array' |
+                            'dict' | 'data' | 'date',
+                    'value': <JSON-safe value>}}}
+
+Domains and keys are sorted, so two snapshots of the same state serialise
+identically. Nothing here needs macOS: point prefs_dir at a directory of
+fixture plists to run it anywhere.
+
+Note that cfprefsd may hold changes in memory for a few seconds before it
+flushes them to disk; the files, not the daemon, are what is read here.
+"""
+
+import base64
+import json
+import os
+import plistlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+PREFERENCES_DIR = Path.home() / 'Library/Preferences'
+CONTAINERS_DIR = Path.home() / 'Library/Containers'
+
+GLOBAL_DOMAINS = ('NSGlobalDomain', 'Apple Global Domain', '-g', '-globalDomain')
+GLOBAL_PLIST = '.GlobalPreferences'
+
+# Domains the shell exporters look at by default
+IMPORTANT_DOMAINS = (
+    'NSGlobalDomain',
+    'com.apple.dock',
+    'com.apple.finder',
+    'com.apple.Safari',
+    'com.apple.Terminal',
+    'com.apple.TextEdit',
+    'com.apple.screensaver',
+    'com.apple.screencapture',
+    'com.apple.ActivityMonitor',
+    'com.apple.mail',
+    'com.apple.SoftwareUpdate',
+    'com.apple.TimeMachine',
+    'com.apple.desktopservices',
+    'com.apple.menuextra.battery',
+    'com.apple.menuextra.clock',
+    'com.apple.spaces',
+    'com.apple.LaunchServices',
+    'com.apple.loginwindow',
+    'com.apple.systempreferences',
+    'com.apple.universalaccess',
+    'com.googlecode.iterm2',
+    'com.sublimetext.3',
+    'com.microsoft.VSCode',
+)
+
+
+def canonical_domain(domain):
+    """NSGlobalDomain for every spelling of the global domain, the domain itself otherwise"""
+    return 'NSGlobalDomain' if domain in GLOBAL_DOMAINS else domain
+
+
+def plist_path(domain, prefs_dir=PREFERENCES_DIR, containers_dir=CONTAINERS_DIR):
+    """
+    File backing a domain, or None if there is none.
+
+    Sandboxed apps (Safari, Mail, ...) keep their preferences inside their
+    container; that location is only consulted when containers_dir is set.
+    """
+    name = GLOBAL_PLIST if domain in GLOBAL_DOMAINS else domain
+    path = Path(prefs_dir) / f"{name}.plist"
+    if path.is_file():
+        return path
+    if containers_dir is not None:
+        path = Path(containers_dir) / name / 'Data/Library/Preferences' / f"{name}.plist"
+        if path.is_file():
+            return path
+    return None
+
+
+def list_domains(prefs_dir=PREFERENCES_DIR):
+    """Every domain with a plist in prefs_dir (ByHost and lock files are skipped)"""
+    domains = set()
+    with os.scandir(prefs_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith('.plist') and entry.is_file():
+                name = entry.name[:-len('.plist')]
+                domains.add('NSGlobalDomain' if name == GLOBAL_PLIST else name)
+    return sorted(domains)
+
+
+def value_type(value):
+    """defaults/osx_defaults type name of a plistlib value"""
+    # bool before int: True is an int as well
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, str):
+        return 'string'
+    if isinstance(value, (list, tuple)):
+        return 'array'
+    if isinstance(value, dict):
+        return 'dict'
+    if isinstance(value, (bytes, bytearray)):
+        return 'data'
+    if isinstance(value, datetime):
+        return 'date'
+    if isinstance(value, plistlib.UID):
+        return 'uid'
+    raise TypeError(f"Unsupported plist value: {value!r}")
+
+
+def json_value(value):
+    """JSON-safe copy of a plistlib value (data as base64, dates as ISO 8601, dict keys sorted)"""
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, plistlib.UID):
+        return value.data
+    if isinstance(value, (list, tuple)):
+        return [json_value(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): json_value(value[k]) for k in sorted(value, key=str)}
+    return value
+
+
+def typed_settings(plist):
+    """{key: {'type': ..., 'value': ...}} for a loaded plist, sorted by key"""
+    return {key: {'type': value_type(plist[key]), 'value': json_value(plist[key])}
+            for key in sorted(plist)}
+
+
+def read_domain(domain, prefs_dir=PREFERENCES_DIR, containers_dir=CONTAINERS_DIR):
+    """Typed settings of one domain, or None if it has no (readable) plist"""
+    path = plist_path(domain, prefs_dir, containers_dir)
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            plist = plistlib.load(f)
+    except (OSError, plistlib.InvalidFileException, ValueError):
+        return None
+    if not isinstance(plist, dict):
+        return None
+    return typed_settings(plist)
+
+
+def snapshot(domains, prefs_dir=PREFERENCES_DIR, containers_dir=CONTAINERS_DIR, jobs=None):
+    """
+    Typed snapshot of several domains, read in parallel.
+
+    Domains without a plist are left out. jobs defaults to the
+    ThreadPoolExecutor default (CPU count + 4, at most 32).
+    """
+    domains = sorted({canonical_domain(d) for d in domains})
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(lambda d: read_domain(d, prefs_dir, containers_dir), domains)
+        return {domain: settings for domain, settings in zip(domains, results) if settings is not None}
+
+
+def save_snapshot(data, path):
+    """Write a snapshot as sorted, indented JSON (atomically)"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True, ensure_ascii=False)
+        f.write('\n')
+    tmp.replace(path)
+
+
+def load_snapshot(path):
+    with open(path, 'r') as f:
+        return json.load(f)
@@ -0,0 +1,377 @@
+"""
+Shared .macos parsing for the migration scripts
+
+tokenize() makes a single streaming pass over a .macos file and yields one
+Record per line, classified once with precompiled patterns:
+
+    BLANK            empty or whitespace-only line
+    SECTION_BORDER   ###...# border line
+    SECTION_TITLE    "# Title  #" line between two borders
+    COMMENT          regular comment line
+    COMMENTED        "#", shebang or commented-out command (#sudo, #defaults, ...)
+    DEFAULTS_WRITE   uncommented line containing "defaults write"
+    COMMAND          other command worth keeping (sudo, killall, launchctl, ...)
+    OTHER            anything else (closing braces, variable assignments, ...)
+
+Only a three-line window is held in memory, so arbitrarily large generated
+scripts are processed in constant memory.
+"""
+
+import hashlib
+import json
+import re
+from collections import namedtuple
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parents[2]
+DEFAULTS_FILE = REPO_DIR / 'inventories/group_vars/macs/defaults.yml'
+INDEX_DIR = Path.home() / '.ansible/macos-convert'
+
+BLANK = 'blank'
+SECTION_BORDER = 'section_border'
+SECTION_TITLE = 'section_title'
+COMMENT = 'comment'
+COMMENTED = 'commented'
+DEFAULTS_WRITE = 'defaults_write'
+COMMAND = 'command'
+OTHER = 'other'
+
+# Commented-out commands (not prose comments)
+COMMENTED_COMMAND_PATTERNS = (
+    '#sudo', '#defaults', '#launchctl', '#killall',
+    '#osascript', '#rm ', '#mv ', '#cp ', '#ln ',
+    '#chmod', '#chflags', '#xattr', '#echo'
+)
+
+# Commands to keep
+COMMAND_PATTERNS = (
+    'sudo', 'osascript', 'killall', 'launchctl',
+    '/usr/libexec/PlistBuddy', 'chflags', 'xattr',
+    'find', 'for app in', 'if [', 'fi', 'done',
+    'printf', 'defaults -currentHost'
+)
+
+
+def _trie_pattern(node):
+    """Regex source for a character trie, sharing common prefixes between alternatives"""
+    end = '' in node
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char != '']
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if end:
+        pattern = '(?:' + pattern + ')?'
+    return pattern
+
+
+class LiteralMatcher(object):
+    """
+    Matches any of a set of literal strings with a single precompiled regex.
+
+    The literals are folded into a trie first, so the regex engine walks shared
+    prefixes once instead of trying every alternative at every position; adding
+    hundreds of domains does not multiply the per-line cost.
+    """
+
+    def __init__(self, literals):
+        self.literals = frozenset(literals)
+        trie = {}
+        for literal in self.literals:
+            node = trie
+            for char in literal:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        self.regex = re.compile(_trie_pattern(trie)) if self.literals else None
+
+    def match(self, text):
+        """True if text starts with one of the literals"""
+        return self.regex is not None and self.regex.match(text) is not None
+
+    def search(self, text):
+        """True if one of the literals occurs anywhere in text"""
+        return self.regex is not None and self.regex.search(text) is not None
+
+    def __len__(self):
+        return len(self.literals)
+
+
+_COMMENTED_COMMAND_MATCHER = LiteralMatcher(COMMENTED_COMMAND_PATTERNS)
+_COMMAND_MATCHER = LiteralMatcher(COMMAND_PATTERNS)
+_DEFAULTS_WRITE_DOMAIN_RE = re.compile(r'defaults write (\S*)')
+_COMMENTED_DEFAULTS_WRITE_RE = re.compile(r'^\s*#\s*defaults write')
+_TOKEN_RE = re.compile(r'[^\s"]+|"[^"]*"')
+_CAMEL_CASE_RE = re.compile(r'([a-z])([A-Z])')
+
+# defaults write type flags -> Ansible osx_defaults types
+TYPE_FLAGS = {
+    '-bool': 'bool',
+    '-int': 'int',
+    '-string': 'string',
+    '-float': 'float',
+    '-array': 'array',
+}
+
+
+class Record(namedtuple('Record', 'lineno line kind domains')):
+    """One classified line of a .macos file (lineno is 1-based, line keeps its newline)"""
+
+    __slots__ = ()
+
+    @property
+    def stripped(self):
+        return self.line.strip()
+
+    @property
+    def is_comment(self):
+        """Prose comment, including section titles"""
+        return self.kind in (COMMENT, SECTION_TITLE)
+
+    @property
+    def is_command(self):
+        return self.kind in (DEFAULTS_WRITE, COMMAND)
+
+    @property
+    def is_commented_defaults_write(self):
+        """Commented-out defaults write, with or without a space after the #"""
+        return _COMMENTED_DEFAULTS_WRITE_RE.match(self.line) is not None
+
+    def writes_domain(self, matcher):
+        """True if the line runs 'defaults write' for a domain starting with one of the matcher's literals"""
+        return any(matcher.match(domain) for domain in self.domains)
+
+
+def is_section_border(stripped):
+    """Check if a stripped line is a section border (### ... #)"""
+    return stripped.startswith('###') and stripped.endswith('#')
+
+
+def classify(line, stripped=None):
+    """Classify a single line without context (section titles need their neighbours)"""
+    if stripped is None:
+        stripped = line.strip()
+
+    if not stripped:
+        return BLANK
+
+    if stripped.startswith('#'):
+        if is_section_border(stripped):
+            return SECTION_BORDER
+        if stripped == '#' or stripped.startswith('#!') or _COMMENTED_COMMAND_MATCHER.match(stripped):
+            return COMMENTED
+        return COMMENT
+
+    if 'defaults write' in line:
+        return DEFAULTS_WRITE
+    if _COMMAND_MATCHER.search(line):
+        return COMMAND
+    return OTHER
+
+
+def tokenize(lines):
+    """
+    Yield a Record for every line of an iterable of lines (e.g. an open file).
+
+    Section titles are recognised with a one-line lookahead:
+        ###############################################################################
+        # Section Title                                                              #
+        ###############################################################################
+    """
+    prev_kind = None
+    pending = None  # (lineno, line, kind, stripped) waiting for the next line
+
+    for lineno, line in enumerate(lines, 1):
+        stripped = line.strip()
+        kind = classify(line, stripped)
+        if pending is not None:
+            p_lineno, p_line, p_kind, p_stripped = pending
+            prev_kind, p_kind = p_kind, _title_kind(prev_kind, p_kind, p_stripped, kind)
+            yield Record(p_lineno, p_line, p_kind, _domains(p_line))
+        pending = (lineno, line, kind, stripped)
+
+    if pending is not None:
+        yield Record(pending[0], pending[1], pending[2], _domains(pending[1]))
+
+
+def _title_kind(prev_kind, kind, stripped, next_kind):
+    """Promote a line to SECTION_TITLE if it sits between two borders"""
+    if (prev_kind == SECTION_BORDER and next_kind == SECTION_BORDER and kind != SECTION_BORDER
+            and stripped.startswith('#') and stripped.endswith('#')):
+        return SECTION_TITLE
+    return kind
+
+
+def _domains(line):
+    """Domains of all 'defaults write <domain>' occurrences in a line"""
+    if 'defaults write' not in line:
+        return ()
+    return tuple(_DEFAULTS_WRITE_DOMAIN_RE.findall(line))
+
+
+def load_domains(defaults_file=DEFAULTS_FILE):
+    """Domains managed by the Ansible defaults list (group_vars/macs/defaults.yml by default)"""
+    import yaml
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(defaults_file, 'r') as f:
+        data = yaml.load(f, Loader=loader) or {}
+    return sorted({setting['domain'] for setting in data.get('defaults') or [] if 'domain' in setting})
+
+
+def read_records(path):
+    """Stream the Records of a .macos file"""
+    with open(path, 'r') as f:
+        yield from tokenize(f)
+
+
+def parse_defaults_write(line):
+    """Parse a defaults write command and return dict with components"""
+    # Pattern: defaults write <domain> <key> <type> <value>
+    # Examples:
+    #   defaults write NSGlobalDomain NSTableViewDefaultSizeMode -int 2
+    #   defaults write NSGlobalDomain AppleShowScrollBars -string "Always"
+    #   defaults write com.apple.dock autohide -bool false
+    line = line.strip()
+    if line.startswith('#') or not line.startswith('defaults write'):
+        return None
+
+    # Split on whitespace, handling quoted strings
+    parts = _TOKEN_RE.findall(line)
+
+    if len(parts) < 4:
+        return None
+
+    domain = parts[2]
+    key = parts[3]
+
+    type_flag = None
+    value = None
+
+    if len(parts) >= 6:
+        type_flag = parts[4]  # -bool, -int, -string, -float, -array, -dict-add
+        value = parts[5].strip('"')
+    elif len(parts) == 5:
+        # Sometimes no explicit type
+        value = parts[4].strip('"')
+
+    if type_flag == '-dict-add':
+        # Complex, skip for now
+        return None
+
+    return {
+        'domain': domain,
+        'key': key,
+        'type': TYPE_FLAGS.get(type_flag),
+        'value': value,
+        'description': describe_key(key),
+        'original_line': line
+    }
+
+
+def describe_key(key):
+    """Generate a description from a key name (camelCase to words)"""
+    description = _CAMEL_CASE_RE.sub(r'\1 \2', key)
+    return description.replace('_', ' ').strip()
+
+
+def iter_settings(records):
+    """Yield (lineno, setting) for every parseable defaults write record"""
+    for record in records:
+        if record.kind == DEFAULTS_WRITE:
+            setting = parse_defaults_write(record.line)
+            if setting:
+                yield record.lineno, setting
+
+
+def convert_to_ansible_yaml(setting):
+    """Convert setting dict to Ansible YAML format"""
+    lines = []
+    lines.append(f"  - domain: {setting['domain']}")
+    lines.append(f"    key: {setting['key']}")
+    lines.append(f"    name: {setting['description']}")
+    if setting['type']:
+        lines.append(f"    type: {setting['type']}")
+    lines.append(f"    value: '{setting['value']}'")
+    return '\n'.join(lines)
+
+
+class ConversionIndex(object):
+    """
+    Persistent index of the settings emitted by a conversion run (line hash -> setting).
+
+    changed_settings() skips unchanged input before it is parsed: if the source
+    file has the size and mtime (or content hash) of the last run, it is not read
+    at all; otherwise only lines whose hash is not in the index are tokenized and
+    parsed, the others are carried over as they are. add() records an emitted
+    setting, removed() lists the settings whose source line disappeared or changed.
+
+    The index does not know the filters of the script using it; delete it after
+    changing them to get a full run.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.previous = {}
+        self.current = {}
+        self.source = {}
+        self.previous_source = {}
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if 'settings' in data:
+                self.previous, self.previous_source = data['settings'], data.get('source') or {}
+            else:  # index written before the source signature was kept
+                self.previous = data
+
+    @staticmethod
+    def line_hash(line):
+        return hashlib.sha1(line.strip().encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def file_hash(path):
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def changed_settings(self, path):
+        """Yield (lineno, setting) for the defaults write lines of path that are not in the index"""
+        st = Path(path).stat()
+        self.source = {'path': str(path), 'size': st.st_size, 'mtime': st.st_mtime_ns}
+        previous = self.previous_source
+        if previous.get('path') == str(path) and previous.get('size') == st.st_size:
+            if previous.get('mtime') == st.st_mtime_ns or previous.get('sha1') == self.file_hash(path):
+                self.source['sha1'] = previous.get('sha1')
+                self.current = dict(self.previous)
+                return
+        self.source['sha1'] = self.file_hash(path)
+
+        with open(path, 'r') as f:
+            for lineno, line in enumerate(f, 1):
+                stripped = line.strip()
+                # The only lines iter_settings() can turn into a setting; none of them
+                # depends on its neighbours, so a known hash means a known setting
+                if not stripped.startswith('defaults write'):
+                    continue
+                digest = self.line_hash(stripped)
+                if digest in self.previous:
+                    self.current[digest] = self.previous[digest]
+                    continue
+                setting = parse_defaults_write(stripped)
+                if setting:
+                    yield lineno, setting
+
+    def add(self, setting):
+        """Record an emitted setting; True if its source line was not in the previous run"""
+        digest = self.line_hash(setting['original_line'])
+        self.current[digest] = {'domain': setting['domain'], 'key': setting['key'], 'line': setting['original_line']}
+        return digest not in self.previous
+
+    def removed(self):
+        return [entry for digest, entry in self.previous.items() if digest not in self.current]
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'source': self.source, 'settings': self.current}, f, indent=1, sort_keys=True)
+        tmp.replace(self.path)
@@ -0,0 +1,169 @@
+"""
+Structural diff of typed defaults snapshots
+
+Snapshots are the {domain: {key: {'type': ..., 'value': ...}}} trees written
+by macos_prefs, hashed as a two-level tree: a domain hash over the whole
+domain and, only below domains whose hash differs, one hash per setting.
+Identical domains are skipped with a single comparison, nested arrays/dicts
+are compared by hash instead of element by element, and a HashedSnapshot
+diffed against many others (a fleet of hosts) is hashed only once.
+
+The changelist is per (domain, key), the granularity `defaults write` and
+the Ansible `defaults` list work at, and can be turned into `defaults:`
+entries with macos_script.convert_to_ansible_yaml.
+"""
+
+import hashlib
+import json
+from collections import namedtuple
+
+from macos_prefs import canonical_domain
+from macos_script import describe_key
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+# Types convert_to_ansible_yaml can express as a single quoted value
+SCALAR_TYPES = ('bool', 'int', 'float', 'string')
+
+TRUE_VALUES = ('true', 'yes', 'on', '1')
+FALSE_VALUES = ('false', 'no', 'off', '0')
+
+
+class Change(namedtuple('Change', 'domain key action type old new')):
+    """One changed setting; old/new are {'type', 'value'} dicts or None"""
+
+    __slots__ = ()
+
+    def to_dict(self):
+        return self._asdict()
+
+
+class HashedSnapshot(object):
+    """A snapshot with lazily computed, cached setting and domain hashes"""
+
+    def __init__(self, data):
+        self.data = data
+        self._key_hashes = {}
+        self._domain_hashes = {}
+
+    @staticmethod
+    def tree_hash(node):
+        encoded = json.dumps(node, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+    def domain_hash(self, domain):
+        """Hash of a whole domain, from one C-encoded serialisation"""
+        digest = self._domain_hashes.get(domain)
+        if digest is None:
+            digest = self._domain_hashes[domain] = self.tree_hash(self.data.get(domain, {}))
+        return digest
+
+    def key_hashes(self, domain):
+        """Per-key hashes, only computed for domains whose hash differs"""
+        hashes = self._key_hashes.get(domain)
+        if hashes is None:
+            hashes = {key: self.tree_hash(setting) for key, setting in self.data.get(domain, {}).items()}
+            self._key_hashes[domain] = hashes
+        return hashes
+
+    def domains(self):
+        return self.data.keys()
+
+
+def diff_snapshots(old, new, domains=None, keys=None):
+    """
+    Changes turning snapshot old into snapshot new, sorted by domain and key.
+
+    old/new are snapshot dicts or HashedSnapshots; domains limits the diff to
+    those domains, keys (a set of (domain, key) pairs) to those settings.
+    """
+    old = old if isinstance(old, HashedSnapshot) else HashedSnapshot(old)
+    new = new if isinstance(new, HashedSnapshot) else HashedSnapshot(new)
+    if domains is None:
+        domains = set(domain for domain, key in keys) if keys is not None else set(old.domains()) | set(new.domains())
+
+    changes = []
+    for domain in sorted(domains):
+        if old.domain_hash(domain) == new.domain_hash(domain):
+            continue
+        old_hashes, new_hashes = old.key_hashes(domain), new.key_hashes(domain)
+        old_settings, new_settings = old.data.get(domain, {}), new.data.get(domain, {})
+        for key in sorted(set(old_hashes) | set(new_hashes)):
+            old_hash, new_hash = old_hashes.get(key), new_hashes.get(key)
+            if old_hash == new_hash or (keys is not None and (domain, key) not in keys):
+                continue
+            if old_hash is None:
+                setting = new_settings[key]
+                changes.append(Change(domain, key, ADDED, setting['type'], None, setting))
+            elif new_hash is None:
+                setting = old_settings[key]
+                changes.append(Change(domain, key, REMOVED, setting['type'], setting, None))
+            else:
+                changes.append(Change(domain, key, CHANGED, new_settings[key]['type'], old_settings[key],
+                                      new_settings[key]))
+    return changes
+
+
+def _typed_value(value, value_type):
+    """Snapshot value for an Ansible defaults list value (osx_defaults semantics)"""
+    try:
+        if value_type in ('bool', 'boolean'):
+            lowered = str(value).lower()
+            if lowered in TRUE_VALUES:
+                return 'bool', True
+            if lowered in FALSE_VALUES:
+                return 'bool', False
+            return 'bool', value
+        if value_type in ('int', 'integer'):
+            return 'int', int(value)
+        if value_type == 'float':
+            return 'float', float(value)
+    except (TypeError, ValueError):
+        return value_type, value
+    if value_type == 'array':
+        return 'array', [str(v) for v in value] if isinstance(value, (list, tuple)) else [str(value)]
+    if value_type == 'string':
+        return 'string', str(value)
+    return value_type, value
+
+
+def typed_setting(setting):
+    """{'type', 'value'} of an Ansible `defaults` list entry, as it would be read back from its plist"""
+    value_type, value = _typed_value(setting.get('value'), setting.get('type') or 'string')
+    return {'type': value_type, 'value': value}
+
+
+def defaults_list_snapshot(settings):
+    """Snapshot of an Ansible `defaults` list (host-specific entries are left out)"""
+    data = {}
+    for setting in settings:
+        if setting.get('host'):
+            continue
+        data.setdefault(canonical_domain(setting['domain']), {})[setting['key']] = typed_setting(setting)
+    return {domain: dict(sorted(keys.items())) for domain, keys in sorted(data.items())}
+
+
+def managed_keys(snapshot):
+    """(domain, key) pairs of a snapshot, e.g. the settings a defaults list manages"""
+    return set((domain, key) for domain, settings in snapshot.items() for key in settings)
+
+
+def change_to_setting(change):
+    """
+    Setting dict for convert_to_ansible_yaml, or None for removals and values
+    (arrays, dicts, data, dates) that a single quoted value cannot express.
+    """
+    if change.action == REMOVED or change.type not in SCALAR_TYPES:
+        return None
+    value = change.new['value']
+    if change.type == 'bool':
+        value = 'true' if value else 'false'
+    return {
+        'domain': change.domain,
+        'key': change.key,
+        'type': change.type,
+        'value': str(value).replace("'", "''"),
+        'description': describe_key(change.key),
+    }
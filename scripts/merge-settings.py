@@ -1,65 +1,169 @@
 #!/usr/bin/env python3
 """
 Merge converted settings with existing defaults.yml, removing duplicates
+
+Modes:
+  merge-settings.py                      two-way merge: add converted settings
+                                         whose (domain, key) is not in defaults.yml
+  merge-settings.py --base OLD.yml       three-way merge of defaults.yml (ours) and
+                                         the converted settings (theirs) against a
+                                         common ancestor
+  merge-settings.py --check-inventory    report (domain, key) value conflicts across
+                                         all group_vars/host_vars defaults lists
+
+Same (domain, key) with a different value or type is reported as a conflict
+rather than silently treated as a duplicate.
 """
 
-import yaml
+import argparse
+import sys
+from collections import Counter
 from pathlib import Path
 
-def load_yaml(file_path):
-    with open(file_path, 'r') as f:
-        return yaml.safe_load(f)
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'lib'))
+from defaults_yaml import (INVENTORY_DIR, SettingsIndex, dump_yaml, load_settings,  # noqa: E402
+                           setting_key, setting_value)
 
-def main():
-    # Load existing defaults.yml
-    existing_file = Path('/Volumes/development/github/tuxpeople/mac-dev-playbook/inventories/group_vars/macs/defaults.yml')
-    existing = load_yaml(existing_file)
-    existing_settings = existing.get('defaults', [])
+def parse_args():
+    parser = argparse.ArgumentParser(description='Merge converted settings with existing defaults.yml')
+    parser.add_argument('--existing', type=Path, default=INVENTORY_DIR / 'group_vars/macs/defaults.yml',
+                        help='defaults.yml to merge into (default: %(default)s)')
+    parser.add_argument('--converted', type=Path, default=Path('/tmp/converted-settings.yml'),
+                        help='converted settings (default: %(default)s)')
+    parser.add_argument('--output', type=Path, default=Path('/tmp/defaults-merged.yml'),
+                        help='merged output (default: %(default)s)')
+    parser.add_argument('--base', type=Path,
+                        help='common ancestor of both files; enables the three-way merge')
+    parser.add_argument('--check-inventory', action='store_true',
+                        help='only report value conflicts across the inventory and exit')
+    return parser.parse_args()
 
-    # Load converted settings
-    converted_file = Path('/tmp/converted-settings.yml')
-    converted = load_yaml(converted_file)
-    converted_settings = converted.get('defaults', [])
+def describe(setting):
+    value_type, value = setting_value(setting)
+    return f"{value_type}={value!r}"
 
-    # Create set of existing (domain, key) pairs
-    existing_keys = {(s['domain'], s['key']) for s in existing_settings}
-
-    # Find new settings (not in existing)
+def two_way_merge(existing_settings, converted_settings):
+    """Existing settings plus converted ones with a new (domain, key); conflicts keep the existing value"""
+    existing = {setting_key(s): s for s in existing_settings}
     new_settings = []
-    duplicate_count = 0
+    duplicates = 0
+    conflicts = []
 
     for setting in converted_settings:
-        key = (setting['domain'], setting['key'])
-        if key not in existing_keys:
+        key = setting_key(setting)
+        if key not in existing:
             new_settings.append(setting)
+            existing[key] = setting
+        elif setting_value(existing[key]) == setting_value(setting):
+            duplicates += 1
+        else:
+            conflicts.append((key, existing[key], setting))
+
+    return existing_settings + new_settings, new_settings, duplicates, conflicts
+
+def three_way_merge(base_settings, ours_settings, theirs_settings):
+    """
+    Merge ours and theirs against base, key by key:
+    a side that left a setting unchanged (or absent) takes the other side's
+    change; changes on both sides conflict and keep ours.
+    """
+    base = {setting_key(s): s for s in base_settings}
+    ours = {setting_key(s): s for s in ours_settings}
+    theirs = {setting_key(s): s for s in theirs_settings}
+
+    def signature(settings, key):
+        return setting_value(settings[key]) if key in settings else None
+
+    merged = []
+    conflicts = []
+    # Keep our order, then append keys only theirs introduced
+    keys = list(ours) + [key for key in theirs if key not in ours]
+    for key in keys:
+        base_sig, our_sig, their_sig = signature(base, key), signature(ours, key), signature(theirs, key)
+        if our_sig == their_sig or their_sig == base_sig:
+            result = ours.get(key)
+        elif our_sig == base_sig:
+            result = theirs.get(key)
         else:
-            duplicate_count += 1
+            conflicts.append((key, ours.get(key), theirs.get(key)))
+            result = ours.get(key)
+        if result is not None:
+            merged.append(result)
+    return merged, conflicts
+
+def print_conflicts(conflicts, ours_label, theirs_label):
+    if not conflicts:
+        return
+    print(f"Value conflicts (kept {ours_label}):")
+    for (domain, key), ours, theirs in conflicts:
+        ours_desc = describe(ours) if ours else 'deleted'
+        theirs_desc = describe(theirs) if theirs else 'deleted'
+        print(f"  {domain} {key}: {ours_label} {ours_desc} / {theirs_label} {theirs_desc}")
+    print()
+
+def check_inventory():
+    index = SettingsIndex.from_inventory()
+    conflicts = list(index.conflicts())
+    print(f"Indexed settings: {len(index)}")
+    print(f"Conflicting settings: {len(conflicts)}")
+    for (domain, key), entries in conflicts:
+        print(f"  {domain} {key}:")
+        for entry in entries:
+            print(f"    {entry.path.relative_to(INVENTORY_DIR)}: {describe(entry.setting)}")
+    return 1 if conflicts else 0
+
+def main():
+    args = parse_args()
+    if args.check_inventory:
+        sys.exit(check_inventory())
+
+    existing_settings = load_settings(args.existing)
+    converted_settings = load_settings(args.converted)
 
     print(f"Existing settings: {len(existing_settings)}")
     print(f"Converted settings: {len(converted_settings)}")
-    print(f"Duplicates found: {duplicate_count}")
-    print(f"New settings to add: {len(new_settings)}")
-    print()
+
+    if args.base:
+        base_settings = load_settings(args.base)
+        merged_settings, conflicts = three_way_merge(base_settings, existing_settings, converted_settings)
+        print(f"Base settings: {len(base_settings)}")
+        print(f"Conflicts found: {len(conflicts)}")
+        print()
+        print_conflicts(conflicts, 'existing', 'converted')
+    else:
+        merged_settings, new_settings, duplicate_count, conflicts = two_way_merge(existing_settings, converted_settings)
+        print(f"Duplicates found: {duplicate_count}")
+        print(f"Conflicts found: {len(conflicts)}")
+        print(f"New settings to add: {len(new_settings)}")
+        print()
+        print_conflicts(conflicts, 'existing', 'converted')
+
+    # Settings of the same (domain, key) in other inventory files
+    index = SettingsIndex.from_inventory()
+    shadowed = [s for s in merged_settings
+                if any(entry.path.resolve() != args.existing.resolve() and setting_value(entry.setting) != setting_value(s)
+                       for entry in index.get(setting_key(s)))]
+    if shadowed:
+        print(f"Warning: {len(shadowed)} merged settings differ from other inventory files (see --check-inventory)")
+        print()
 
     # Write merged settings
     merged = {
-        'defaults': existing_settings + new_settings
+        'defaults': merged_settings
     }
 
-    output_file = Path('/tmp/defaults-merged.yml')
-    with open(output_file, 'w') as f:
+    with open(args.output, 'w') as f:
         # Write header comment
         f.write("---\n")
         f.write("# macOS defaults settings\n")
         f.write("# Settings migrated from .macos script on 2025-12-24\n")
         f.write("\n")
-        yaml.dump(merged, f, default_flow_style=False, sort_keys=False, allow_unicode=True)
+        dump_yaml(merged, f)
 
-    print(f"Merged settings written to: {output_file}")
+    print(f"Merged settings written to: {args.output}")
     print(f"Total settings in merged file: {len(merged['defaults'])}")
 
     # Also print counts by domain
-    from collections import Counter
     domain_counts = Counter(s['domain'] for s in merged['defaults'])
     print("\nSettings by domain:")
     for domain, count in sorted(domain_counts.items(), key=lambda x: -x[1]):
@@ -4,66 +4,45 @@ Remove all migrated settings from .macos
 These settings are now in Ansible defaults.yml
 """
 
-from pathlib import Path
 import re
+import sys
+from collections import Counter
+from pathlib import Path
 
-def should_keep_line(line):
-    """Determine if a line should be kept in .macos"""
-    stripped = line.strip()
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'lib'))
+from macos_script import BLANK, LiteralMatcher, load_domains, read_records  # noqa: E402
 
+# Domains now managed by Ansible (every domain in group_vars/macs/defaults.yml),
+# compiled once into a single matcher
+MIGRATED_DOMAINS = LiteralMatcher(load_domains())
+
+def should_keep_record(record):
+    """Determine if a line should be kept in .macos"""
     # Keep empty lines, comments (except commented defaults write), section headers
-    if not stripped or stripped.startswith('###'):
+    if record.kind == BLANK or record.stripped.startswith('###'):
         return True
 
     # Keep non-defaults-write lines (sudo, pmset, launchctl, etc.)
-    if 'defaults write' not in line:
+    if not record.domains:
         return True
 
     # Remove if it's a defaults write for migrated domains
-    migrated_domains = [
-        # Phase 1 domains (High Priority - System Level)
-        'NSGlobalDomain',
-        'com.apple.dock',
-        'com.apple.finder',
-        'com.apple.screensaver',
-        'com.apple.screencapture',
-
-        # Phase 2 domains (Medium Priority - App Specific but Stable)
-        'com.apple.ActivityMonitor',
-        'com.apple.TextEdit',
-        'com.apple.terminal',
-        'com.apple.Terminal',
-        'com.apple.DiskUtility',
-        'com.apple.SoftwareUpdate',
-        'com.apple.TimeMachine',
-    ]
-
-    for domain in migrated_domains:
-        if f'defaults write {domain}' in line:
-            return False
-
-    # Keep everything else
-    return True
+    return not record.writes_domain(MIGRATED_DOMAINS)
 
 def clean_macos_file(input_path, output_path):
-    """Remove migrated settings from .macos"""
-    kept_lines = []
+    """Remove migrated settings from .macos, streaming line by line"""
+    kept_count = 0
     removed_lines = []
-    line_num = 0
 
-    with open(input_path, 'r') as f:
-        for line in f:
-            line_num += 1
-            if should_keep_line(line):
-                kept_lines.append(line)
+    with open(output_path, 'w') as out:
+        for record in read_records(input_path):
+            if should_keep_record(record):
+                out.write(record.line)
+                kept_count += 1
             else:
-                removed_lines.append((line_num, line.strip()))
-
-    # Write cleaned file
-    with open(output_path, 'w') as f:
-        f.writelines(kept_lines)
+                removed_lines.append((record.lineno, record.stripped))
 
-    return kept_lines, removed_lines
+    return kept_count, removed_lines
 
 def main():
     input_file = Path.home() / 'development/github/tuxpeople/dotfiles/.macos'
@@ -78,13 +57,12 @@ def main():
 
     kept, removed = clean_macos_file(input_file, output_file)
 
-    print(f"Original lines: {len(kept) + len(removed)}")
-    print(f"Kept lines: {len(kept)}")
+    print(f"Original lines: {kept + len(removed)}")
+    print(f"Kept lines: {kept}")
     print(f"Removed lines: {len(removed)}")
     print()
 
     # Group removed lines by domain
-    from collections import Counter
     domains = Counter()
     for _, line in removed:
         match = re.search(r'defaults write (\S+)', line)